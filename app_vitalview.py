@@ -1,13 +1,19 @@
 # app_vitalview.py — VitalView (Login + Plans + Forgot Password + Stripe-ready)
 # Run: pip install streamlit pandas numpy altair bcrypt
-# Optional: pip install stripe reportlab
-
-import os, time, secrets, sqlite3
+# Optional: pip install stripe reportlab pyarrow python-calamine
+
+import os, re, json, time, secrets, sqlite3, hashlib, zipfile, warnings
+import functools, operator
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
 from urllib.parse import quote_plus
 import streamlit as st
 import pandas as pd
 import numpy as np
 import altair as alt
+from vitalview_sheets import fetch_sheet_csv, sheet_csv_url
 # --- SAFE XLSX EXPORT FALLBACK --
 
 try:
@@ -34,6 +40,27 @@ try:
     from reportlab.lib.utils import simpleSplit
 except Exception:
     canvas = None
+
+# ---- Optional Arrow dataset store (safe if not installed) ----
+try:
+    import pyarrow as pa
+except Exception:
+    pa = None
+
+# ---- Optional fast Excel engine (safe if not installed) ----
+try:
+    import python_calamine  # used by pandas >= 2.2 via engine="calamine"
+    EXCEL_ENGINE = "calamine"
+except Exception:
+    EXCEL_ENGINE = None     # pandas default (openpyxl in read-only mode for .xlsx)
+
+# ---- Optional forkserver workers for batch parsing (POSIX only) ----
+try:
+    from multiprocessing import popen_forkserver, forkserver as mp_forkserver
+    from multiprocessing import reduction as mp_reduction, spawn as mp_spawn, util as mp_util
+    from multiprocessing.context import ForkServerContext, ForkServerProcess, set_spawning_popen
+except Exception:
+    popen_forkserver = None  # batch files are parsed in-process instead
 # ---- Altair theme (optional) ----
 import altair as alt
 
@@ -1141,20 +1168,397 @@ def _save_narrative(text: str, state_list, county_list):
         "counties": list(county_list) if county_list else [],
         "text": text,
     })
-def enforce_schema(df: pd.DataFrame) -> pd.DataFrame:
-    req = {"state","county","fips","year","indicator","value","unit"}
-    df = df.copy()
-    df.columns = [c.strip().lower() for c in df.columns]
-    missing = req - set(df.columns)
+SCHEMA_COLUMNS = ["state","county","fips","year","indicator","value","unit"]
+# what enforce_schema returns: the schema plus the integer county key
+NORMALIZED_COLUMNS = SCHEMA_COLUMNS + ["fips_code"]
+# text columns stored as categoricals → whether they get title-cased
+SCHEMA_LABEL_COLUMNS = {"state": True, "county": True, "fips": False, "indicator": False, "unit": False}
+
+
+def _normalize_labels(col: pd.Series, title: bool = False):
+    """
+    Strip (and optionally title-case) only the distinct values of a column,
+    then map the row codes back. Returns (codes, categories) so the caller can
+    drop rows before building the Categorical. Only all-lower/all-upper labels
+    are title-cased, so "DeKalb" or "McHenry" keep their spelling.
+    """
+    codes, uniques = pd.factorize(col)
+    labels = pd.Index(uniques).astype(str).str.strip()
+    if title and len(labels):
+        shouting = np.asarray(labels.str.islower() | labels.str.isupper(), dtype=bool)
+        labels = labels.where(~shouting, labels.str.title())
+    label_codes, categories = pd.factorize(labels)
+    # labels that collapse together ("cook " / "Cook") share one category; -1 stays missing
+    remap = np.append(label_codes, -1)
+    return remap[codes], pd.Index(categories)
+
+
+# ---------- County reference (FIPS-keyed) ----------
+# 5-digit county FIPS → state, canonical county name and known spellings. Names
+# are matched on a loose key (case, spacing, punctuation, "County"/"Saint"
+# ignored), so "De Kalb County", "DEKALB" and "DeKalb" all resolve to 17037.
+STATE_FIPS = {
+    "01": ("Alabama", "AL"), "02": ("Alaska", "AK"), "04": ("Arizona", "AZ"), "05": ("Arkansas", "AR"),
+    "06": ("California", "CA"), "08": ("Colorado", "CO"), "09": ("Connecticut", "CT"), "10": ("Delaware", "DE"),
+    "11": ("District of Columbia", "DC"), "12": ("Florida", "FL"), "13": ("Georgia", "GA"), "15": ("Hawaii", "HI"),
+    "16": ("Idaho", "ID"), "17": ("Illinois", "IL"), "18": ("Indiana", "IN"), "19": ("Iowa", "IA"),
+    "20": ("Kansas", "KS"), "21": ("Kentucky", "KY"), "22": ("Louisiana", "LA"), "23": ("Maine", "ME"),
+    "24": ("Maryland", "MD"), "25": ("Massachusetts", "MA"), "26": ("Michigan", "MI"), "27": ("Minnesota", "MN"),
+    "28": ("Mississippi", "MS"), "29": ("Missouri", "MO"), "30": ("Montana", "MT"), "31": ("Nebraska", "NE"),
+    "32": ("Nevada", "NV"), "33": ("New Hampshire", "NH"), "34": ("New Jersey", "NJ"), "35": ("New Mexico", "NM"),
+    "36": ("New York", "NY"), "37": ("North Carolina", "NC"), "38": ("North Dakota", "ND"), "39": ("Ohio", "OH"),
+    "40": ("Oklahoma", "OK"), "41": ("Oregon", "OR"), "42": ("Pennsylvania", "PA"), "44": ("Rhode Island", "RI"),
+    "45": ("South Carolina", "SC"), "46": ("South Dakota", "SD"), "47": ("Tennessee", "TN"), "48": ("Texas", "TX"),
+    "49": ("Utah", "UT"), "50": ("Vermont", "VT"), "51": ("Virginia", "VA"), "53": ("Washington", "WA"),
+    "54": ("West Virginia", "WV"), "55": ("Wisconsin", "WI"), "56": ("Wyoming", "WY"), "72": ("Puerto Rico", "PR"),
+}
+
+# Illinois counties in FIPS order (17001, 17003, … 17203 — odd numbers, alphabetical)
+_IL_COUNTIES_BY_FIPS = [
+    "Adams", "Alexander", "Bond", "Boone", "Brown", "Bureau", "Calhoun", "Carroll", "Cass", "Champaign",
+    "Christian", "Clark", "Clay", "Clinton", "Coles", "Cook", "Crawford", "Cumberland", "DeKalb", "De Witt",
+    "Douglas", "DuPage", "Edgar", "Edwards", "Effingham", "Fayette", "Ford", "Franklin", "Fulton", "Gallatin",
+    "Greene", "Grundy", "Hamilton", "Hancock", "Hardin", "Henderson", "Henry", "Iroquois", "Jackson", "Jasper",
+    "Jefferson", "Jersey", "Jo Daviess", "Johnson", "Kane", "Kankakee", "Kendall", "Knox", "Lake", "LaSalle",
+    "Lawrence", "Lee", "Livingston", "Logan", "McDonough", "McHenry", "McLean", "Macon", "Macoupin", "Madison",
+    "Marion", "Marshall", "Mason", "Massac", "Menard", "Mercer", "Monroe", "Montgomery", "Morgan", "Moultrie",
+    "Ogle", "Peoria", "Perry", "Piatt", "Pike", "Pope", "Pulaski", "Putnam", "Randolph", "Richland",
+    "Rock Island", "St. Clair", "Saline", "Sangamon", "Schuyler", "Scott", "Shelby", "Stark", "Stephenson", "Tazewell",
+    "Union", "Vermilion", "Wabash", "Warren", "Washington", "Wayne", "White", "Whiteside", "Will", "Williamson",
+    "Winnebago", "Woodford",
+]
+_COUNTY_EXTRA_ALIASES = {
+    "17043": ["Du Page"], "17037": ["De Kalb"], "17039": ["DeWitt", "Dewitt"], "17099": ["La Salle"],
+    "17163": ["Saint Clair"], "17085": ["JoDaviess"],
+}
+COUNTY_REFERENCE = {
+    f"17{2 * i + 1:03d}": {"state": "Illinois", "county": name, "aliases": _COUNTY_EXTRA_ALIASES.get(f"17{2 * i + 1:03d}", [])}
+    for i, name in enumerate(_IL_COUNTIES_BY_FIPS)
+}
+
+
+def _name_key(name) -> str:
+    """Loose matching key for place names."""
+    key = str(name).casefold().strip()
+    key = re.sub(r"\s+(county|parish|borough)$", "", key)
+    key = re.sub(r"^saint\b", "st", key)
+    return re.sub(r"[^0-9a-z]", "", key)
+
+
+STATE_LOOKUP = {_name_key(label): code for code, names in STATE_FIPS.items() for label in names}
+STATE_ABBR = {name: abbr for name, abbr in STATE_FIPS.values()}
+COUNTY_NAME_INDEX = {(fips[:2], _name_key(alias)): fips
+                     for fips, ref in COUNTY_REFERENCE.items() for alias in [ref["county"], *ref["aliases"]]}
+
+
+def pad_fips(raw) -> str:
+    """'17031', '17031.0', 1031, ' 1031 ' → zero-padded 5-digit FIPS, or None."""
+    if raw is None or (isinstance(raw, float) and np.isnan(raw)):
+        return None
+    text = re.sub(r"\.0+$", "", str(raw).strip())
+    return text.zfill(5) if text.isdigit() and 1 <= len(text) <= 5 else None
+
+
+# FIPS problems resolve_county reports (0 = none)
+FIPS_ISSUES = {
+    1: "Invalid FIPS (not a 1–5 digit code)",
+    2: "FIPS state doesn't match the state column",
+    3: "FIPS county doesn't match the county column",
+}
+
+
+def resolve_county(state, county, fips) -> tuple:
+    """
+    (state, county, fips) as found in the data → (state, county, fips5, fips_code, issue).
+    A known FIPS resolves the place; without one the county name is looked up
+    within its state. A FIPS whose 2-digit prefix isn't the row's state, or
+    whose reference county isn't the row's county, is reported in `issue` (see
+    FIPS_ISSUES): the state/county names then win if they resolve, and a state
+    conflict otherwise keeps the row's own labels with fips_code 0 (an
+    unrecognized county spelling keeps the FIPS). Invalid codes keep their
+    original text as the fips label (fips_code still comes from the names when
+    they resolve), so the "FIPS is 5 digits" rule sees them. Unresolvable
+    places keep their labels, with fips_code 0.
+    """
+    text = None if fips is None or (isinstance(fips, float) and np.isnan(fips)) else str(fips).strip()
+    fips5 = pad_fips(text) if text else None
+    issue = 1 if text and fips5 is None else 0
+    state_code = STATE_LOOKUP.get(_name_key(state)) if state is not None else None
+    name_fips = COUNTY_NAME_INDEX.get((state_code, _name_key(county))) if state_code and county is not None else None
+
+    if fips5 is not None and state_code and fips5[:2] != state_code:
+        issue = 2
+    elif fips5 is not None and county is not None and fips5 in COUNTY_REFERENCE and name_fips != fips5:
+        issue = 3
+    if fips5 is None or issue == 2 or (issue == 3 and name_fips):
+        fips5, fips_label = name_fips, (name_fips or fips5 or text)
+    else:
+        fips_label = fips5
+
+    if issue == 1:
+        fips_label = text
+    ref = COUNTY_REFERENCE.get(fips5)
+    if ref is not None:
+        return ref["state"], ref["county"], fips_label, int(fips5), issue
+    if state_code:
+        state = STATE_FIPS[state_code][0]
+    return state, county, fips_label, int(fips5) if fips5 else 0, issue
+
+
+def apply_county_reference(state: pd.Categorical, county: pd.Categorical, fips: pd.Categorical) -> tuple:
+    """
+    Resolve every distinct (state, county, fips) combination once and map the
+    result back through the codes. Returns (state, county, fips) categoricals,
+    an int32 fips_code array (0 = unknown) and an int8 FIPS_ISSUES code per row.
+    """
+    parts = [np.asarray(c.codes, dtype="int64") + 1 for c in (state, county, fips)]
+    sizes = [len(c.categories) + 1 for c in (state, county, fips)]
+    combo = (parts[0] * sizes[1] + parts[1]) * sizes[2] + parts[2]
+    combo_id, uniq = pd.factorize(combo)
+    f_code = uniq % sizes[2]
+    c_code = (uniq // sizes[2]) % sizes[1]
+    s_code = uniq // (sizes[2] * sizes[1])
+
+    def label(cats, code):
+        return cats[code - 1] if code > 0 else None
+
+    resolved = [resolve_county(label(state.categories, s), label(county.categories, c), label(fips.categories, f))
+                for s, c, f in zip(s_code, c_code, f_code)]
+    out = []
+    for col in range(3):
+        codes, cats = pd.factorize(pd.Series([r[col] for r in resolved], dtype=object), use_na_sentinel=True)
+        out.append(pd.Categorical.from_codes(codes[combo_id], categories=pd.Index(cats).astype(str)))
+    fips_code = np.array([r[3] for r in resolved], dtype="int32")[combo_id]
+    issues = np.array([r[4] for r in resolved], dtype="int8")[combo_id]
+    return out[0], out[1], out[2], fips_code, issues
+
+
+def county_keys(df: pd.DataFrame) -> np.ndarray:
+    """
+    Integer county key per row: the FIPS code, or a negative id per unresolved
+    (state, county) pair within this frame, so unknown counties never merge.
+    """
+    if "fips_code" not in df.columns:
+        ids, _ = pd.factorize(row_keys(df, ["state", "county", "fips"]))
+        return -(ids.astype("int64") + 1)
+    code = df["fips_code"].to_numpy(dtype="int64")
+    unknown = code <= 0
+    if unknown.any():
+        code = code.copy()
+        ids, _ = pd.factorize(row_keys(df[unknown], ["state", "county"]))
+        code[unknown] = -(ids.astype("int64") + 1)
+    return code
+
+
+# enforce_schema report counters (summed when a file is normalized in parts) and row previews
+SCHEMA_REPORT_COUNTS = ("rows_in", "rows_kept", "dropped", "bad_year", "bad_value", "fips_invalid", "fips_mismatch")
+SCHEMA_REPORT_PREVIEWS = ("dropped_preview", "fips_preview")
+
+
+def enforce_schema(df: pd.DataFrame, report: dict = None, value_dtype: str = "float64") -> pd.DataFrame:
+    """
+    Normalize a raw table to the VitalView long format in one pass:
+      - state/county/fips/indicator/unit → categoricals (state & county title-cased)
+      - state/county/fips resolved against COUNTY_REFERENCE, plus an int32 fips_code
+        (invalid or contradicting FIPS are counted and previewed in the report)
+      - year → smallest integer dtype, value → value_dtype
+      - rows with a non-numeric value, or a year that isn't a whole number, are dropped
+    If `report` is a dict it is filled with what was dropped and why.
+    Wide tables (one column per indicator) are melted first — see normalize_wide.
+    """
+    if is_wide_table(df):
+        return normalize_wide(df, report=report, value_dtype=value_dtype)
+    cols = {str(c).strip().lower(): df[c] for c in df.columns}
+    missing = set(SCHEMA_COLUMNS) - set(cols)
     if missing:
         st.error(f"Missing columns: {missing}"); st.stop()
-    df["year"] = pd.to_numeric(df["year"], errors="coerce")
-    df["value"] = pd.to_numeric(df["value"], errors="coerce")
-    df = df.dropna(subset=["year","value"])
-    for col in ("state","county","indicator","unit"):
-        df[col] = df[col].astype(str).str.strip()
-        if col in ("state","county"): df[col] = df[col].str.title()
-    return df
+
+    year = pd.to_numeric(cols["year"], errors="coerce").to_numpy(dtype="float64")
+    value = pd.to_numeric(cols["value"], errors="coerce").to_numpy(dtype=value_dtype)
+    with np.errstate(invalid="ignore"):
+        bad_year = ~(np.isfinite(year) & (year == np.round(year)))   # e.g. "2020.5" is no year either
+    bad_value = np.isnan(value)
+    keep = ~(bad_year | bad_value)
+
+    all_kept = bool(keep.all())
+    out = {}
+    for name, col in cols.items():
+        if name in SCHEMA_LABEL_COLUMNS:
+            codes, cats = _normalize_labels(col, title=SCHEMA_LABEL_COLUMNS[name])
+            out[name] = pd.Categorical.from_codes(codes if all_kept else codes[keep], categories=cats)
+        elif name == "year":
+            out[name] = pd.to_numeric(year if all_kept else year[keep], downcast="integer")
+        elif name == "value":
+            out[name] = value if all_kept else value[keep]
+        else:
+            out[name] = col.array if all_kept else col.array[keep]
+    out["state"], out["county"], out["fips"], out["fips_code"], fips_issue = apply_county_reference(
+        out["state"], out["county"], out["fips"])
+    clean = pd.DataFrame(out)
+
+    if report is not None:
+        dropped_pos = np.flatnonzero(~keep)
+        preview = df.iloc[dropped_pos[:200]].copy()
+        if not preview.empty:
+            reasons = np.where(bad_year[dropped_pos[:200]], "Invalid year", "Non-numeric value")
+            both = bad_year[dropped_pos[:200]] & bad_value[dropped_pos[:200]]
+            preview.insert(0, "drop_reason", np.where(both, "Invalid year and non-numeric value", reasons))
+            preview.insert(0, "source_row", dropped_pos[:200] + 1)
+        # rows kept but with an invalid or contradicting FIPS (see resolve_county)
+        issue_pos = np.flatnonzero(fips_issue)[:200]
+        issue_src = issue_pos if all_kept else np.flatnonzero(keep)[issue_pos]
+        fips_preview = df.iloc[issue_src].copy()
+        if not fips_preview.empty:
+            fips_preview.insert(0, "fips_issue", [FIPS_ISSUES[i] for i in fips_issue[issue_pos]])
+            fips_preview.insert(0, "source_row", issue_src + 1)
+        report.update({
+            "rows_in": int(len(keep)),
+            "rows_kept": int(keep.sum()),
+            "dropped": int(len(dropped_pos)),
+            "bad_year": int(bad_year.sum()),
+            "bad_value": int(bad_value.sum()),
+            "dropped_preview": preview,
+            "fips_invalid": int((fips_issue == 1).sum()),
+            "fips_mismatch": int((fips_issue > 1).sum()),
+            "fips_preview": fips_preview,
+        })
+    return clean
+
+# ---------- Wide-format ingestion (one column per indicator) ----------
+# Partner files often carry one row per county-year and one column per indicator.
+# They're detected by having the id columns, no indicator/value columns, and mostly
+# numeric other columns (so a long file with misnamed columns isn't melted), and
+# melted in blocks of indicator columns so only ~STREAM_CHUNK_ROWS long rows exist
+# at a time before being compacted by enforce_schema.
+WIDE_ID_COLUMNS = ["state", "county", "fips", "year"]
+WIDE_SAMPLE_ROWS = 1000   # rows sampled per column when checking that indicator columns are numeric
+# (pattern in the column name, unit) — first match wins
+WIDE_UNIT_PATTERNS = [
+    (re.compile(r"\(\s*%\s*\)|%|\bpercent\b|\bpct\b", re.I), "percent"),
+    (re.compile(r"[µu]g\s*/\s*m(³|3|\^3)", re.I), "ugm3"),
+    (re.compile(r"per\s*100,?000|per\s*100k", re.I), "per100k"),
+    (re.compile(r"per\s*1,?000\b|per\s*1k", re.I), "per1k"),
+    (re.compile(r"\(\s*\$\s*\)|\busd\b|dollars", re.I), "usd"),
+    (re.compile(r"\(\s*years?\s*\)", re.I), "years"),
+]
+
+
+def infer_unit(indicator: str) -> str:
+    """Guess a unit from an indicator column name, e.g. "PM2.5 (µg/m³)" → "ugm3"."""
+    for pattern, unit in WIDE_UNIT_PATTERNS:
+        if pattern.search(str(indicator)):
+            return unit
+    return "unknown"
+
+
+def is_wide_header(columns) -> bool:
+    """Has the id columns plus other columns, but no indicator/value columns."""
+    cols = {str(c).strip().lower() for c in columns}
+    return (set(WIDE_ID_COLUMNS) <= cols and not cols & {"indicator", "value"}
+            and len(cols - set(WIDE_ID_COLUMNS) - {"unit"}) > 0)
+
+
+def is_wide_table(df: pd.DataFrame) -> bool:
+    """
+    A wide header (is_wide_header) whose other columns are mostly numeric: more
+    than half of the columns with data must be mostly numbers over their first
+    WIDE_SAMPLE_ROWS rows (blank cells ignored). A frame with no data is judged on its header.
+    """
+    if not is_wide_header(df.columns):
+        return False
+    skip = set(WIDE_ID_COLUMNS) | {"unit"}
+    numeric = checked = 0
+    for c in df.columns:
+        if str(c).strip().lower() in skip:
+            continue
+        sample = df[c].head(WIDE_SAMPLE_ROWS).dropna()
+        if sample.dtype == object or pd.api.types.is_string_dtype(sample.dtype):
+            sample = sample[sample.astype(str).str.strip() != ""]
+        if sample.empty:
+            continue
+        checked += 1
+        if pd.api.types.is_numeric_dtype(sample.dtype) and not pd.api.types.is_bool_dtype(sample.dtype):
+            numeric += 1
+        else:
+            numeric += pd.to_numeric(sample, errors="coerce").notna().mean() > 0.5
+    return checked == 0 or numeric * 2 > checked
+
+
+def normalize_wide(df: pd.DataFrame, report: dict = None, value_dtype: str = "float64",
+                   chunk_rows: int = None) -> pd.DataFrame:
+    """
+    Melt a wide table into the long format and normalize it.
+    Id columns are factorized once and their codes repeated per block; values are
+    read column-wise and raveled, so there is no per-row Python work. Empty cells
+    are skipped (counted in report["empty_cells"]); non-numeric cells are dropped
+    and reported like enforce_schema does, with source_row pointing at the wide row.
+    A `unit` column, when present, gives the unit for every indicator in its row;
+    rows where it's blank fall back to the unit inferred from the column name
+    (report["unit_source"] says which was used).
+    """
+    lower = {str(c).strip().lower(): c for c in df.columns}
+    id_src = [lower[c] for c in WIDE_ID_COLUMNS]
+    ind_src = [c for c in df.columns if str(c).strip().lower() not in set(WIDE_ID_COLUMNS) | {"unit"}]
+    n, k = len(df), len(ind_src)
+    block = max(1, (chunk_rows or STREAM_CHUNK_ROWS) // max(n, 1))
+
+    ids = {}
+    for name, src in zip(WIDE_ID_COLUMNS, id_src):
+        if name != "year":
+            codes, uniques = pd.factorize(df[src])
+            ids[name] = (codes, pd.Index(uniques))
+    years = df[lower["year"]].to_numpy()
+    names = [str(c).strip() for c in ind_src]
+    unit_codes, unit_cats = pd.factorize(pd.Index([infer_unit(c) for c in names]))
+    row_units = None
+    if "unit" in lower:
+        text = df[lower["unit"]].astype("string").str.strip()
+        ru_codes, ru_uniques = pd.factorize(text.mask(text == ""))
+        if len(ru_uniques):
+            unit_cats = unit_cats.append(pd.Index(ru_uniques, dtype=object)).unique()
+            row_units = np.append(unit_cats.get_indexer(ru_uniques), -1)[ru_codes]   # -1 → infer
+
+    totals = dict.fromkeys(SCHEMA_REPORT_COUNTS + ("empty_cells",), 0)
+    frames, previews = [], {p: [] for p in SCHEMA_REPORT_PREVIEWS}
+    for start in range(0, k, block):
+        cols = ind_src[start:start + block]
+        raw = df[cols]
+        empty = raw.isna().to_numpy().ravel()
+        values = raw.apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64").ravel()
+        filled = np.flatnonzero(~empty)
+        src_rows = filled // len(cols)                      # wide row of each long row
+        ind_codes = start + filled % len(cols)              # indicator column of each long row
+
+        long = {name: pd.Categorical.from_codes(codes[src_rows], categories=uniques)
+                for name, (codes, uniques) in ids.items()}
+        long["year"] = years[src_rows]
+        long["indicator"] = pd.Categorical.from_codes(ind_codes, categories=names)
+        long["value"] = values[filled]
+        units = unit_codes[ind_codes]
+        if row_units is not None:
+            units = np.where(row_units[src_rows] >= 0, row_units[src_rows], units)
+        long["unit"] = pd.Categorical.from_codes(units, categories=unit_cats)
+        long_df = pd.DataFrame(long)[SCHEMA_COLUMNS]
+        totals["empty_cells"] += int(empty.sum())
+
+        rep = {}
+        frames.append(enforce_schema(long_df, report=rep, value_dtype=value_dtype))
+        for key in SCHEMA_REPORT_COUNTS:
+            totals[key] += rep[key]
+        for pkey, kept in previews.items():
+            prev = rep[pkey]
+            if len(prev) and sum(len(p) for p in kept) < 200:
+                prev["source_row"] = src_rows[prev["source_row"].to_numpy() - 1] + 1
+                kept.append(prev)
+
+    clean = concat_normalized(frames)
+    if report is not None:
+        report.update(totals)
+        report["wide_indicators"] = k
+        report["unit_source"] = "unit column" if row_units is not None else "column names"
+        for pkey, kept in previews.items():
+            report[pkey] = pd.concat(kept).head(200) if kept else pd.DataFrame()
+    return clean
 # ===== Local resource linker =====
 def local_resources(state: str, county: str) -> list[tuple[str,str,str]]:
     """
@@ -1223,15 +1627,77 @@ def to_excel_bytes(df: pd.DataFrame) -> bytes:
 
     return buffer.getvalue()
 
-def zscore(s: pd.Series) -> pd.Series:
-    s = pd.to_numeric(s, errors="coerce").astype(float)
-    std = s.std(ddof=0) or 1.0
-    return (s - s.mean()) / std
+# Above this many county × indicator cells, sums/counts are accumulated over the
+# observed cells only instead of a dense cell array.
+PIVOT_DENSE_MAX_CELLS = int(os.getenv("VITALVIEW_PIVOT_DENSE_CELLS", "20000000"))
+
+
+def _pivot_codes(df: pd.DataFrame):
+    """
+    Integer coordinates of the rows with a value → (pos, row, first, col, names):
+    row positions used, county index per row (see county_keys), each county's
+    first row position, indicator index per row and the indicator names.
+    Counties are numbered in (state, county, fips) label order and indicators in
+    name order — compared as strings, not category codes — which is the order
+    pivot_table gave. Indicators with no values are left out. None when nothing has a value.
+    """
+    ind = df["indicator"]
+    if isinstance(ind.dtype, pd.CategoricalDtype):
+        col, names = ind.cat.codes.to_numpy(dtype="int64"), ind.cat.categories
+    else:
+        col, names = pd.factorize(ind, sort=True)
+    pos = np.flatnonzero((col >= 0) & ~np.isnan(df["value"].to_numpy(dtype="float64")))
+    if not len(pos): return None
+
+    row, uniq = pd.factorize(county_keys(df)[pos])
+    first = np.empty(len(uniq), dtype="int64")
+    first[row[::-1]] = pos[::-1]
+    labels = df[["state", "county", "fips"]].iloc[first].astype(object).reset_index(drop=True)
+    by_label = labels.sort_values(["state", "county", "fips"], kind="stable").index.to_numpy()
+    rank = np.empty(len(first), dtype="int64")
+    rank[by_label] = np.arange(len(first))
+    row, first = rank[row], first[by_label]
+
+    used = np.bincount(col[pos], minlength=len(names)) > 0
+    names = pd.Index(names[used]).astype(str)
+    by_name = np.argsort(np.asarray(names, dtype=object), kind="stable")
+    rank = np.empty(len(names), dtype="int64")
+    rank[by_name] = np.arange(len(names))
+    col = rank[(np.cumsum(used) - 1)[col[pos]]]
+    return pos, row, first, col, names[by_name]
+
+
+def _cell_means(cell: np.ndarray, value: np.ndarray, shape: tuple) -> np.ndarray:
+    """Mean of `value` per flat cell index as a dense array of `shape` (NaN where empty)."""
+    n_cells = int(np.prod(shape))
+    if n_cells <= PIVOT_DENSE_MAX_CELLS:
+        sums = np.bincount(cell, weights=value, minlength=n_cells)
+        counts = np.bincount(cell, minlength=n_cells)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (sums / counts).reshape(shape)
+    cell_id, cells = pd.factorize(cell)
+    out = np.full(shape, np.nan)
+    out.flat[cells] = np.bincount(cell_id, weights=value) / np.bincount(cell_id)
+    return out
+
 
 def derive_pivot(df_latest: pd.DataFrame) -> pd.DataFrame:
+    """
+    County × indicator means — what pivot_table(aggfunc="mean") returned, built
+    with bincount. Rows are grouped on the integer county key (see county_keys)
+    and labelled (state, county, fips) from each county's first row; rows and
+    columns are in _pivot_codes' label order. Missing values don't count, and
+    counties or indicators with no values are left out.
+    """
     if df_latest is None or df_latest.empty: return pd.DataFrame()
-    return df_latest.pivot_table(index=["state","county","fips"],
-                                 columns="indicator", values="value", aggfunc="mean")
+    codes = _pivot_codes(df_latest)
+    if codes is None: return pd.DataFrame()
+    pos, row, first, col, names = codes
+    value = df_latest["value"].to_numpy(dtype="float64")[pos]
+    mat = _cell_means(row * len(names) + col, value, (len(first), len(names)))
+
+    labels = df_latest[["state", "county", "fips"]].iloc[first].reset_index(drop=True)
+    return pd.DataFrame(mat, index=pd.MultiIndex.from_frame(labels), columns=pd.Index(names, name="indicator"))
 
 def to_pdf_bytes(text: str, title="VitalView Report") -> bytes:
     if canvas is None: return b""
@@ -1247,6 +1713,972 @@ def to_pdf_bytes(text: str, title="VitalView Report") -> bytes:
             c.drawString(margin,y,line); y -= 0.16*inch
     c.showPage(); c.save(); pdf = buf.getvalue(); buf.close(); return pdf
 
+# ---------- Flexible loaders: CSV, Excel, Google Sheets ----------
+
+# ---------- JSON / NDJSON records → long format ----------
+# Partner API exports arrive either flat ({state, county, ..., indicator, value, unit})
+# or with the indicators nested under one key, e.g.
+#   {"state": "Illinois", "county": "Cook", "fips": "17031", "year": 2022,
+#    "indicators": {"Obesity (%)": 31.2, "PM2.5 (µg/m³)": {"value": 9.1, "unit": "ugm3"}}}
+#   {"geo": {...}, "year": 2022, "metrics": [{"indicator": "...", "value": 1.0, "unit": "..."}]}
+# Nested records become one row per indicator. NDJSON is read line by line.
+# Rows without a unit get infer_unit(indicator), and every chunk carries all of
+# SCHEMA_COLUMNS, so a streamed file can't stop halfway on a chunk missing one.
+JSON_NESTED_KEYS = ("indicators", "metrics", "measures", "values", "data")
+JSON_WRAPPER_KEYS = ("data", "records", "rows", "results", "items")
+JSON_EXTS = (".json", ".ndjson", ".jsonl")
+
+
+def _flatten_json_records(records: list) -> pd.DataFrame:
+    """
+    Flatten a list of JSON records (flat or with nested indicators) into
+    long-format rows with every SCHEMA_COLUMNS column (missing ones empty).
+    """
+    rows = []
+    for rec in records:
+        if not isinstance(rec, dict):
+            continue
+        base = {}
+        nested = None
+        for k, v in rec.items():
+            k = str(k).strip().lower()
+            if nested is None and k in JSON_NESTED_KEYS and isinstance(v, (dict, list)):
+                nested = v
+            elif isinstance(v, dict):
+                base.update((str(ik).strip().lower(), iv) for ik, iv in v.items())  # e.g. "geo": {...}
+            else:
+                base[k] = v
+        if nested is None:
+            rows.append(base)
+        else:
+            items = nested.items() if isinstance(nested, dict) else ((None, v) for v in nested)
+            for name, item in items:
+                row = dict(base)
+                if isinstance(item, dict):
+                    row.update((str(k).strip().lower(), v) for k, v in item.items())
+                    if name is not None:
+                        row.setdefault("indicator", name)
+                else:
+                    row["indicator"], row["value"] = name, item
+                rows.append(row)
+    for row in rows:
+        if row.get("unit") is None and row.get("indicator") is not None:
+            row["unit"] = infer_unit(row["indicator"])
+    out = pd.DataFrame.from_records(rows)
+    for c in SCHEMA_COLUMNS:
+        if c not in out.columns:
+            out[c] = None
+    return out
+
+
+def _is_ndjson(file_obj, name: str = "") -> bool:
+    """.ndjson/.jsonl by name, otherwise sniff for a complete JSON object on line one and another object after it."""
+    if name.lower().endswith((".ndjson", ".jsonl")):
+        return True
+    head = file_obj.read(65536)
+    file_obj.seek(0)
+    head = head.lstrip() if isinstance(head, bytes) else head.encode("utf-8").lstrip()
+    if not head.startswith(b"{"):
+        return False
+    lines = [l for l in head.split(b"\n", 2)[:2] if l.strip()]
+    try:
+        return len(lines) == 2 and lines[1].lstrip().startswith(b"{") and isinstance(json.loads(lines[0]), dict)
+    except ValueError:
+        return False
+
+
+def iter_json_chunks(file_obj, chunk_rows: int = None, name: str = None):
+    """
+    Yield long-format DataFrames of about chunk_rows source records each.
+    NDJSON is parsed one line at a time, so only one chunk of records is held
+    in memory; a regular JSON document (a list of records, or an object
+    wrapping one) has to be parsed whole first.
+    """
+    chunk_rows = chunk_rows or STREAM_CHUNK_ROWS
+    name = name if name is not None else getattr(file_obj, "name", "")
+    file_obj.seek(0)
+    if _is_ndjson(file_obj, name):
+        batch = []
+        for lineno, line in enumerate(file_obj, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                batch.append(json.loads(line))
+            except ValueError as e:
+                raise ValueError(f"Invalid JSON on line {lineno}: {e}") from None
+            if len(batch) >= chunk_rows:
+                yield _flatten_json_records(batch)
+                batch = []
+        if batch:
+            yield _flatten_json_records(batch)
+        return
+
+    doc = json.load(file_obj)
+    if isinstance(doc, dict):
+        wrapped = next((doc[k] for k in JSON_WRAPPER_KEYS if isinstance(doc.get(k), list)), None)
+        doc = wrapped if wrapped is not None else [doc]
+    for start in range(0, len(doc), chunk_rows):
+        yield _flatten_json_records(doc[start:start + chunk_rows])
+
+
+def read_json_table(file_obj) -> pd.DataFrame:
+    """Whole-file JSON/NDJSON read (flattened to long format)."""
+    frames = [f for f in iter_json_chunks(file_obj) if not f.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+# extension → reader. pandas readers can be handed to the batch loader's worker
+# processes; readers defined in this script are run in-process.
+TABLE_READERS = {
+    ".csv": pd.read_csv,
+    ".xlsx": pd.read_excel,
+    ".xls": pd.read_excel,
+    ".xlsm": pd.read_excel,
+    ".ods": pd.read_excel,
+    ".json": read_json_table,
+    ".ndjson": read_json_table,
+    ".jsonl": read_json_table,
+}
+
+
+def load_any_table(file_obj: "UploadedFile") -> pd.DataFrame:
+    """
+    Read a CSV, Excel-like or JSON file from the Streamlit uploader.
+    Supports: .csv, .xlsx, .xls, .xlsm, .ods, .json, .ndjson, .jsonl
+    """
+    ext = os.path.splitext(file_obj.name.lower())[1]
+
+    # Fallback: try CSV as a last resort
+    return TABLE_READERS.get(ext, pd.read_csv)(file_obj)
+
+
+# ---------- Dataset cache (content hash → normalized DataFrame) ----------
+# Streamlit re-runs this whole script on every widget change, so the parsed +
+# normalized upload is kept in session_state keyed on a hash of its bytes.
+# Bump SCHEMA_VERSION whenever enforce_schema changes what it produces.
+SCHEMA_VERSION = 3
+DATASET_CACHE_MAX_ENTRIES = 4
+DATASET_CACHE_MAX_BYTES = int(os.getenv("VITALVIEW_CACHE_MB", "512")) * 1024 * 1024
+
+
+def dataset_fingerprint(data: bytes, *extra) -> str:
+    """Stable content hash for an upload (plus any loader options and the schema version)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(data)
+    for part in extra:
+        h.update(b"\x00" + str(part).encode("utf-8"))
+    h.update(f"\x00schema-v{SCHEMA_VERSION}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def upload_digest(file_obj) -> str:
+    """
+    Content hash of an uploaded file, hashed once per upload: memoized per
+    (file_id, size) in the session, so reruns (every slider tick) don't re-read
+    a multi-GB upload just to find its cache key.
+    """
+    file_id = getattr(file_obj, "file_id", None)
+    memo_key = (file_id, int(getattr(file_obj, "size", 0) or 0)) if file_id else None
+    if memo_key is not None:
+        cached = lru_get("upload_digests", memo_key)
+        if cached is not None:
+            return cached
+    digest = hashlib.blake2b(file_obj.getvalue(), digest_size=16).hexdigest()
+    if memo_key is not None:
+        lru_put("upload_digests", memo_key, digest, max_entries=64)
+    return digest
+
+
+def _approx_nbytes(obj) -> int:
+    """Rough size of a cached value: frames, arrays and indexes, summed through tuples, lists and dicts."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, pd.Index):
+        return int(obj.memory_usage())
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, (tuple, list)):
+        return sum(_approx_nbytes(o) for o in obj)
+    if isinstance(obj, dict):
+        return sum(_approx_nbytes(o) for o in obj.values())
+    return 0
+
+
+def lru_get(cache_name: str, key):
+    """Return a cached value (and mark it most-recently used), or None."""
+    store = st.session_state.get(cache_name)
+    if store is None or key not in store:
+        return None
+    store.move_to_end(key)
+    return store[key][0]
+
+
+def lru_put(cache_name: str, key, value, max_entries: int, max_bytes: int = None):
+    """
+    Insert into a session-scoped LRU cache.
+    Oldest entries are evicted until both the entry limit and byte ceiling hold
+    (the newest entry is always kept, even if it alone exceeds the ceiling).
+    """
+    if cache_name not in st.session_state:
+        st.session_state[cache_name] = OrderedDict()
+    store = st.session_state[cache_name]
+    store[key] = (value, _approx_nbytes(value))
+    store.move_to_end(key)
+
+    total = sum(size for _, size in store.values())
+    while len(store) > 1 and (
+        len(store) > max_entries or (max_bytes is not None and total > max_bytes)
+    ):
+        _, (_, size) = store.popitem(last=False)
+        total -= size
+    return value
+
+
+def load_dataset(file_obj: "UploadedFile", stream: bool = False, sheet=0) -> tuple:
+    """
+    Parse + normalize an uploaded file once per distinct content.
+    Large CSV/JSON files (or stream=True) go through the chunked streaming reader;
+    workbooks go through the pruned Excel reader for the chosen sheet.
+    Returns (dataset_key, df, schema_report). The cached frame is shared across reruns — treat it as read-only.
+    """
+    ext = file_obj.name.lower().rsplit(".", 1)[-1]
+    is_excel = f".{ext}" in EXCEL_EXTS
+    is_json = f".{ext}" in JSON_EXTS
+    stream = (ext == "csv" or is_json) and (stream or int(getattr(file_obj, "size", 0) or 0) > STREAM_THRESHOLD_BYTES)
+    key = dataset_fingerprint(upload_digest(file_obj).encode("utf-8"), ext, "stream" if stream else "", sheet if is_excel else "")
+    cached = lru_get("dataset_cache", key)
+    if cached is not None:
+        return (key,) + cached
+
+    if stream:
+        streamer = stream_json_dataset if is_json else stream_csv_dataset
+        df_norm, report = streamer(file_obj, key, progress=st.sidebar.progress(0.0, text="Streaming…"))
+        lru_put("dataset_cache", key, (df_norm, report), DATASET_CACHE_MAX_ENTRIES, DATASET_CACHE_MAX_BYTES)
+        return key, df_norm, report
+
+    report = {}
+    raw_df = read_excel_fast(file_obj, sheet) if is_excel else load_any_table(file_obj)
+    df_norm = enforce_schema(raw_df, report=report)
+    lru_put("dataset_cache", key, (df_norm, report), DATASET_CACHE_MAX_ENTRIES, DATASET_CACHE_MAX_BYTES)
+    return key, df_norm, report
+
+# ---------- Row keys, duplicates & additive dataset stats ----------
+# Defined ahead of the store/upsert helpers and the sidebar data-load block,
+# which call them while the script is still running top to bottom.
+# Rows are duplicates when they share this key (comma-separated column list in VITALVIEW_DUP_KEY).
+# "county_key" is a virtual column: the FIPS code, or state + county when FIPS is blank
+# (see county_keys), so counties without a FIPS never collapse into one another.
+DUPLICATE_KEY = [c.strip().lower() for c in os.getenv("VITALVIEW_DUP_KEY", "county_key,year,indicator").split(",") if c.strip()]
+
+
+def _key_columns(df: pd.DataFrame, key: list) -> list:
+    cols = [c for c in (key or DUPLICATE_KEY) if c in df.columns or c == "county_key"]
+    return cols or list(df.columns)
+
+
+def _comparable_county_keys(df: pd.DataFrame) -> np.ndarray:
+    """
+    county_keys that line up across frames: the FIPS code where known, otherwise
+    a negative 63-bit hash of the (state, county) labels.
+    """
+    code = df["fips_code"].to_numpy(dtype="int64") if "fips_code" in df.columns else np.zeros(len(df), dtype="int64")
+    unknown = code <= 0
+    if unknown.any():
+        code = code.copy()
+        labels = df.loc[unknown, [c for c in ("state", "county") if c in df.columns]]
+        h = pd.util.hash_pandas_object(labels.astype(object), index=False).to_numpy()
+        code[unknown] = -(h >> np.uint64(1)).astype("int64") - 1
+    return code
+
+
+def key_hashes(df: pd.DataFrame, key: list = None) -> np.ndarray:
+    """
+    One 64-bit hash per row over the key columns (all columns when none of them exist).
+    Years hash as int64 so frames with different year dtypes line up; county_key
+    hashes as _comparable_county_keys.
+    """
+    cols = _key_columns(df, key)
+    keys = pd.DataFrame({c: _comparable_county_keys(df) if c == "county_key" else df[c] for c in cols})
+    if "year" in keys.columns and pd.api.types.is_integer_dtype(keys["year"].dtype):
+        keys["year"] = keys["year"].astype("int64")
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def row_keys(df: pd.DataFrame, key: list = None) -> np.ndarray:
+    """
+    One int64 per row identifying its key within this frame: the key columns'
+    category/factorize codes packed together (categoricals cost nothing to code).
+    Falls back to key_hashes when the packed codes wouldn't fit in 63 bits.
+    Unlike key_hashes, values are only comparable within the same frame.
+    """
+    cols = _key_columns(df, key)
+    packed = np.zeros(len(df), dtype="int64")
+    span = 1
+    for c in cols:
+        col = county_keys(df) if c == "county_key" else df[c]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            codes, size = col.cat.codes.to_numpy(dtype="int64"), len(col.cat.categories)
+        else:
+            codes, uniques = pd.factorize(col)
+            codes, size = codes.astype("int64"), len(uniques)
+        size += 1                                   # room for missing (-1 → 0)
+        if span * size >= 2**63:
+            return key_hashes(df, key).view("int64")
+        packed = packed * size + (codes + 1)
+        span *= size
+    return packed
+
+
+def find_duplicates(df: pd.DataFrame, key: list = None) -> dict:
+    """
+    Key every row once (row_keys → factorize) and reuse the group ids for:
+      duplicate — a later row whose key already appeared (the first one is kept)
+      conflict  — any row whose key appears with more than one distinct value
+    All O(n) array ops; no sort. Returns {"duplicate", "conflict"} boolean arrays plus counts.
+    """
+    n = len(df)
+    empty = np.zeros(n, dtype=bool)
+    if n == 0:
+        return {"duplicate": empty, "conflict": empty, "n_duplicates": 0, "n_conflict_keys": 0}
+    # factorize numbers groups in order of first appearance, so a row repeats an
+    # earlier key exactly when its id isn't above every id seen before it
+    group, uniques = pd.factorize(row_keys(df, key))
+    seen_max = np.maximum.accumulate(np.r_[-1, group[:-1]])
+    duplicate = group <= seen_max
+    if not duplicate.any():
+        return {"duplicate": duplicate, "conflict": empty, "n_duplicates": 0, "n_conflict_keys": 0}
+
+    conflict = empty
+    n_conflict_keys = 0
+    if "value" in df.columns:
+        value = df["value"].to_numpy(dtype="float64")
+        first = value[np.flatnonzero(~duplicate)][group]     # each row's first value for its key
+        differs = (value != first) & ~np.isnan(value) & ~np.isnan(first)
+        group_conflict = np.bincount(group, weights=differs, minlength=len(uniques)) > 0
+        n_conflict_keys = int(group_conflict.sum())
+        conflict = group_conflict[group]
+    return {"duplicate": duplicate, "conflict": conflict,
+            "n_duplicates": int(duplicate.sum()), "n_conflict_keys": n_conflict_keys}
+
+
+def _label_counts(col) -> dict:
+    counts = pd.Series(col).value_counts(sort=False, dropna=True)
+    return {str(k): int(v) for k, v in counts.items() if v}
+
+
+def compute_dataset_stats(df: pd.DataFrame) -> dict:
+    """
+    Additive dataset stats (JSON-serializable), so an upsert can update them by
+    subtracting the replaced rows and adding the new ones:
+    row/missing/negative/duplicate counts, per-year and per-county row counts,
+    and per-indicator [n, sum, sum of squares, nulls].
+    """
+    if df is None or df.empty:
+        return {"rows": 0, "missing_values": 0, "negatives": 0, "duplicates": 0,
+                "year_counts": {}, "county_counts": {}, "indicators": {}}
+    value = df["value"].to_numpy(dtype="float64")
+    ok = ~np.isnan(value)
+    v = np.where(ok, value, 0.0)
+    per_ind = pd.DataFrame({"indicator": df["indicator"].to_numpy(), "n": ok, "s": v, "s2": v * v, "nulls": ~ok})
+    per_ind = per_ind.groupby("indicator", observed=True).sum()
+    return {
+        "rows": int(len(df)),
+        "missing_values": int(df.isna().sum().sum()),
+        "negatives": int((value < 0).sum()),
+        "duplicates": find_duplicates(df)["n_duplicates"],
+        "year_counts": _label_counts(df["year"]),
+        "county_counts": _label_counts(df["county"]),
+        "indicators": {str(k): [int(r.n), float(r.s), float(r.s2), int(r.nulls)] for k, r in per_ind.iterrows()},
+    }
+
+
+def combine_dataset_stats(a: dict, b: dict, sign: int = 1) -> dict:
+    """a + sign·b for compute_dataset_stats results; zero-count entries are dropped."""
+    out = {}
+    for k, av in a.items():
+        bv = b.get(k)
+        if isinstance(av, dict):
+            merged = {key: list(val) if isinstance(val, list) else val for key, val in av.items()}
+            for key, val in (bv or {}).items():
+                if isinstance(val, list):
+                    cur = merged.get(key, [0] * len(val))
+                    merged[key] = [x + sign * y for x, y in zip(cur, val)]
+                else:
+                    merged[key] = merged.get(key, 0) + sign * val
+            out[k] = {key: val for key, val in merged.items()
+                      if (val[0] or val[-1] if isinstance(val, list) else val)}
+        else:
+            out[k] = av + sign * (bv or 0)
+    return out
+
+
+# ---------- Columnar dataset store (Arrow IPC, memory-mapped) ----------
+# Normalized long-format data is written as an uncompressed Arrow file with
+# dictionary-encoded text columns, so reopening it is a memory-map rather than
+# a CSV parse. Requires pyarrow; the store UI hides itself when it's missing.
+DATA_STORE_DIR = os.getenv("VITALVIEW_STORE_DIR", "vitalview_store")
+STORE_DICT_COLUMNS = ["state", "county", "fips", "indicator", "unit"]
+
+
+def _store_path(name: str, store_dir: str = None) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", (name or "").strip()).strip("._") or "dataset"
+    return os.path.join(store_dir or DATA_STORE_DIR, f"{safe}.arrow")
+
+
+def list_stored_datasets() -> list:
+    """Names of datasets saved in the local store (newest first)."""
+    if pa is None or not os.path.isdir(DATA_STORE_DIR):
+        return []
+    files = [f for f in os.listdir(DATA_STORE_DIR) if f.endswith(".arrow")]
+    files.sort(key=lambda f: os.path.getmtime(os.path.join(DATA_STORE_DIR, f)), reverse=True)
+    return [f[:-len(".arrow")] for f in files]
+
+
+def save_dataset_store(df: pd.DataFrame, name: str, stats: dict = None) -> str:
+    """
+    Write a normalized frame to the store and return its path.
+    Its dataset stats (computed here unless passed in) ride along in the file
+    metadata, so reopening it doesn't rescan the rows.
+    """
+    if pa is None:
+        raise RuntimeError("Install pyarrow to use the dataset store:  pip install pyarrow")
+    out = df.reset_index(drop=True)
+    for c in STORE_DICT_COLUMNS:
+        if c in out.columns and not isinstance(out[c].dtype, pd.CategoricalDtype):
+            out[c] = out[c].astype("category")
+    table = pa.Table.from_pandas(out, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b"vitalview_schema": str(SCHEMA_VERSION).encode("utf-8"),
+        b"vitalview_stats": json.dumps(stats if stats is not None else compute_dataset_stats(out)).encode("utf-8"),
+    })
+
+    os.makedirs(DATA_STORE_DIR, exist_ok=True)
+    path = _store_path(name)
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+    return path
+
+
+def _read_store_file(path: str, with_stats: bool = False) -> tuple:
+    """
+    Memory-map an Arrow store file → (df, written_by_current_schema), plus the
+    saved dataset stats (or None) when with_stats is set.
+    """
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    meta = table.schema.metadata or {}
+    current = meta.get(b"vitalview_schema") == str(SCHEMA_VERSION).encode("utf-8")
+    if not with_stats:
+        return table.to_pandas(split_blocks=True), current
+    stats = json.loads(meta[b"vitalview_stats"]) if current and b"vitalview_stats" in meta else None
+    return table.to_pandas(split_blocks=True), current, stats
+
+
+def load_dataset_store(name: str) -> tuple:
+    """
+    Memory-map a stored dataset back into pandas. Returns (dataset_key, df, schema_report).
+    Dictionary columns come back as categoricals; files written by an older
+    schema version are re-normalized on the way in.
+    """
+    if pa is None:
+        raise RuntimeError("Install pyarrow to use the dataset store:  pip install pyarrow")
+    path = _store_path(name)
+    key = f"store:{os.path.basename(path)}:{os.path.getmtime(path)}:v{SCHEMA_VERSION}"
+    cached = lru_get("dataset_cache", key)
+    if cached is not None:
+        return (key,) + cached
+
+    df_store, current, stats = _read_store_file(path, with_stats=True)
+    report = {}
+    if not current:
+        df_store = enforce_schema(df_store, report=report)
+    if stats is not None:
+        lru_put("dataset_stats", key, stats, DATASET_CACHE_MAX_ENTRIES)
+
+    lru_put("dataset_cache", key, (df_store, report), DATASET_CACHE_MAX_ENTRIES, DATASET_CACHE_MAX_BYTES)
+    return key, df_store, report
+
+
+# ---------- Incremental updates (upsert on county + year + indicator) ----------
+# A refresh file only carries the new/changed rows. Rows whose key matches the
+# update are replaced, new keys are appended, and the dataset stats are moved
+# by (− replaced rows + update rows) instead of being recomputed over everything.
+UPSERT_KEY = ["county_key", "year", "indicator"]   # county_key: see DUPLICATE_KEY
+
+
+def upsert_dataset(base: pd.DataFrame, update: pd.DataFrame, base_stats: dict = None) -> tuple:
+    """
+    Merge normalized `update` rows into `base` keyed on (county, year, indicator),
+    the county being its FIPS code or, when that's blank, its state + county labels;
+    the last update row wins for a repeated key. Returns (merged, stats, counts)
+    where counts = {"replaced": base rows replaced, "added": update keys new to
+    the base, "unchanged": base rows kept}.
+    """
+    upd_hash = key_hashes(update, UPSERT_KEY)
+    last = ~pd.Series(upd_hash).duplicated(keep="last").to_numpy()
+    update = update[last]
+    upd_hash = upd_hash[last]
+
+    base_hash = key_hashes(base, UPSERT_KEY)
+    replaced = pd.Series(base_hash).isin(upd_hash).to_numpy()
+    added = int((~pd.Series(upd_hash).isin(base_hash)).sum())
+    merged = concat_normalized([base[~replaced], update])
+
+    if base_stats is None:
+        base_stats = compute_dataset_stats(base)
+    stats = combine_dataset_stats(
+        combine_dataset_stats(base_stats, compute_dataset_stats(base[replaced]), sign=-1),
+        compute_dataset_stats(update),
+    )
+    n_replaced = int(replaced.sum())
+    counts = {"replaced": n_replaced, "added": added, "unchanged": int(len(base) - n_replaced)}
+    return merged, stats, counts
+
+
+def upsert_dataset_store(name: str, update: pd.DataFrame) -> dict:
+    """Upsert normalized rows into a stored dataset and rewrite it. Returns the upsert counts."""
+    if pa is None:
+        raise RuntimeError("Install pyarrow to use the dataset store:  pip install pyarrow")
+    base, current, stats = _read_store_file(_store_path(name), with_stats=True)
+    if not current:
+        base = enforce_schema(base)
+    merged, stats, counts = upsert_dataset(base, update, base_stats=stats)
+    save_dataset_store(merged, name, stats=stats)
+    return counts
+
+def load_sheet_dataset(url: str) -> tuple:
+    """
+    Google Sheet → (dataset_key, df, schema_report). The fetched CSV bytes are
+    fingerprinted before parsing, so a rerun with an unchanged export is a cache
+    lookup; they are only parsed and normalized when they change.
+    """
+    data = fetch_sheet_csv(sheet_csv_url(url))
+    key = dataset_fingerprint(data, "gsheet")
+    cached = lru_get("dataset_cache", key)
+    if cached is not None:
+        return (key,) + cached
+    report = {}
+    df_norm = enforce_schema(pd.read_csv(BytesIO(data)), report=report)
+    lru_put("dataset_cache", key, (df_norm, report), DATASET_CACHE_MAX_ENTRIES, DATASET_CACHE_MAX_BYTES)
+    return key, df_norm, report
+
+# ---------- Fast Excel path (sheet picker + column pruning) ----------
+EXCEL_EXTS = (".xlsx", ".xls", ".xlsm", ".ods")
+
+
+def _read_excel_bytes(data: bytes, **kwargs) -> pd.DataFrame:
+    if EXCEL_ENGINE:
+        try:
+            return pd.read_excel(BytesIO(data), engine=EXCEL_ENGINE, **kwargs)
+        except ValueError:
+            pass  # pandas < 2.2 doesn't know the calamine engine
+    return pd.read_excel(BytesIO(data), **kwargs)
+
+
+def excel_sheet_names(file_obj) -> list:
+    """Sheet names of an uploaded workbook (cached by content hash)."""
+    key = dataset_fingerprint(upload_digest(file_obj).encode("utf-8"), "sheets")
+    cached = lru_get("excel_sheets", key)
+    if cached is not None:
+        return cached
+    # sheet_name=None with nrows=0 returns {sheet: empty frame} without parsing any rows
+    names = list(_read_excel_bytes(file_obj.getvalue(), sheet_name=None, nrows=0).keys())
+    return lru_put("excel_sheets", key, names, max_entries=8)
+
+
+def pruned_read_kwargs(header) -> dict:
+    """
+    usecols/dtype for a reader given the file's header: only the seven VitalView
+    columns are kept (every column of a wide-looking table, since each one is an
+    indicator), and fips and label columns are read as text so "01001" stays "01001".
+    """
+    if is_wide_header(header):   # maybe wide: keep every column, enforce_schema checks the values
+        keep = list(header)
+    else:
+        keep = [c for c in header if str(c).strip().lower() in SCHEMA_COLUMNS]
+        if not keep:
+            return {}            # let enforce_schema report what's missing
+    text_cols = {c: str for c in keep if str(c).strip().lower() in ("fips", *SCHEMA_LABEL_COLUMNS)}
+    return {"dtype": text_cols} if len(keep) == len(header) else {"usecols": keep, "dtype": text_cols}
+
+
+def read_excel_fast(file_obj, sheet=0) -> pd.DataFrame:
+    """
+    Read one sheet through pruned_read_kwargs. The header is read first so the
+    remaining columns are never converted.
+    """
+    data = file_obj.getvalue()
+    header = _read_excel_bytes(data, sheet_name=sheet, nrows=0).columns
+    return _read_excel_bytes(data, sheet_name=sheet, **pruned_read_kwargs(header))
+
+# ---------- Batch ingestion (many files / .zip, parsed in parallel) ----------
+BATCH_MAX_WORKERS = int(os.getenv("VITALVIEW_BATCH_WORKERS", "0")) or None
+# Streamlit serves sessions from threads, and forking a threaded process can copy
+# held locks into the child, so workers come from a forkserver. A plain forkserver
+# (or spawn) worker re-runs __main__ from its path first — under Streamlit that's
+# this whole app — so batch workers are launched with preparation data that
+# leaves __main__ out. Without forkserver support the files are parsed in-process.
+if popen_forkserver is not None:
+    class _BatchPopen(popen_forkserver.Popen):
+        """popen_forkserver.Popen._launch, minus the __main__ entries of the preparation data."""
+        def _launch(self, process_obj):
+            process_obj.__dict__.pop("_Popen", None)   # set by _BatchContext; the worker can't unpickle it
+            prep_data = {k: v for k, v in mp_spawn.get_preparation_data(process_obj._name).items()
+                         if k not in ("init_main_from_path", "init_main_from_name")}
+            buf = BytesIO()
+            set_spawning_popen(self)
+            try:
+                mp_reduction.dump(prep_data, buf)
+                mp_reduction.dump(process_obj, buf)
+            finally:
+                set_spawning_popen(None)
+            self.sentinel, w = mp_forkserver.connect_to_new_process(self._fds)
+            parent_w = os.dup(w)   # keeps the child's parent-alive sentinel open, as the stdlib does
+            self.finalizer = mp_util.Finalize(self, mp_util.close_fds, (parent_w, self.sentinel))
+            with open(w, "wb", closefd=True) as f:
+                f.write(buf.getbuffer())
+            self.pid = mp_forkserver.read_signed(self.sentinel)
+
+    class _BatchContext(ForkServerContext):
+        """forkserver context whose processes start through _BatchPopen."""
+        def Process(self, *args, **kwargs):
+            proc = ForkServerProcess(*args, **kwargs)
+            proc._Popen = _BatchPopen
+            return proc
+
+
+def _expand_batch(files) -> list:
+    """
+    Flatten uploads (and any .zip archives) into [(name, bytes)] for supported
+    file types; repeated names get a " (n)" suffix so every file has its own label.
+    """
+    items = []
+    for f in files:
+        data = f.getvalue()
+        if f.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(BytesIO(data)) as zf:
+                for info in zf.infolist():
+                    inner = info.filename
+                    if info.is_dir() or inner.startswith("__MACOSX/") or os.path.basename(inner).startswith("."):
+                        continue
+                    if os.path.splitext(inner.lower())[1] in TABLE_READERS:
+                        items.append((f"{f.name}/{inner}", zf.read(info)))
+        else:
+            items.append((f.name, data))
+    # two exports called data.csv stay two files: "data.csv", "data.csv (2)"
+    seen = set()
+    for i, (name, data) in enumerate(items):
+        label, n = name, 1
+        while label in seen:
+            n += 1
+            label = f"{name} ({n})"
+        seen.add(label)
+        items[i] = (label, data)
+    return items
+
+
+def _batch_reader(name: str, data: bytes):
+    """
+    Reader for one batch file. CSV and Excel get a pandas reader with the file's
+    pruned_read_kwargs (and the calamine engine when it reads this workbook) bound
+    in, so it pickles into a worker and parses like the single-file path.
+    Other types get their TABLE_READERS entry.
+    """
+    reader = TABLE_READERS.get(os.path.splitext(name.lower())[1], pd.read_csv)
+    try:
+        if reader is pd.read_csv:
+            header = pd.read_csv(BytesIO(data), nrows=0).columns
+            return functools.partial(pd.read_csv, **pruned_read_kwargs(header))
+        if reader is pd.read_excel:
+            engine = {}
+            if EXCEL_ENGINE:
+                try:
+                    header = pd.read_excel(BytesIO(data), engine=EXCEL_ENGINE, nrows=0).columns
+                    engine = {"engine": EXCEL_ENGINE}
+                except ValueError:
+                    header = None  # pandas < 2.2 doesn't know the calamine engine
+            if not engine:
+                header = pd.read_excel(BytesIO(data), nrows=0).columns
+            return functools.partial(pd.read_excel, **engine, **pruned_read_kwargs(header))
+    except Exception:
+        pass  # unreadable header: the plain reader reports the error
+    return reader
+
+
+def _parse_batch(items: list, max_workers: int = None) -> list:
+    """
+    Parse [(name, bytes)] in a process pool → [(name, DataFrame | Exception)], in input order.
+    Workers (see _BatchContext) only run the pandas readers (script-defined readers such
+    as JSON can't be pickled into a worker, so they run here); falls back to serial
+    parsing if a pool can't start. Results are kept by position, not name.
+    """
+    jobs = [(name, _batch_reader(name, data), data) for name, data in items]
+    results = [None] * len(jobs)
+    done = np.zeros(len(jobs), dtype=bool)
+    if len(jobs) > 1 and popen_forkserver is not None:
+        try:
+            ctx = _BatchContext()
+            ctx.set_forkserver_preload(["pandas"])
+            with ProcessPoolExecutor(max_workers=max_workers or min(len(jobs), os.cpu_count() or 1),
+                                     mp_context=ctx) as ex:
+                futures = {ex.submit(reader, BytesIO(data)): i for i, (_, reader, data) in enumerate(jobs)
+                           if getattr(reader, "func", reader).__module__ != __name__}
+                for fut in as_completed(futures):
+                    i = futures[fut]
+                    try:
+                        results[i] = fut.result()
+                    except Exception as e:
+                        results[i] = e
+                    done[i] = True
+        except (OSError, RuntimeError, BrokenProcessPool):
+            done[:] = False
+    for i, (name, reader, data) in enumerate(jobs):
+        if not done[i]:
+            try:
+                buf = BytesIO(data)
+                buf.name = name
+                results[i] = reader(buf)
+            except Exception as e:
+                results[i] = e
+    return [(name, res) for (name, _, _), res in zip(jobs, results)]
+
+
+def load_batch(files) -> tuple:
+    """
+    Load many uploads (or zips of CSV/Excel/JSON) as one dataset.
+    Each file is parsed in parallel, normalized through enforce_schema, tagged with a
+    `source_file` column, and concatenated. Returns (dataset_key, df, report).
+    """
+    digest = "".join(f"{f.name}:{upload_digest(f)};" for f in files)
+    key = dataset_fingerprint(digest.encode("utf-8"), "batch")
+    cached = lru_get("dataset_cache", key)
+    if cached is not None:
+        return (key,) + cached
+    items = _expand_batch(files)
+    if not items:
+        raise ValueError("No CSV, Excel, or JSON files found in the upload.")
+
+    names = [name for name, _ in items]
+    report = {**dict.fromkeys(SCHEMA_REPORT_COUNTS, 0), "files": [], "failed": []}
+    frames, previews = [], {p: [] for p in SCHEMA_REPORT_PREVIEWS}
+    for i, (name, raw) in enumerate(_parse_batch(items, BATCH_MAX_WORKERS)):
+        if isinstance(raw, Exception):
+            report["failed"].append((name, str(raw)))
+            continue
+        if not (set(SCHEMA_COLUMNS) <= {str(c).strip().lower() for c in raw.columns} or is_wide_table(raw)):
+            report["failed"].append((name, "missing required VitalView columns"))
+            continue
+        rep = {}
+        norm = enforce_schema(raw, report=rep)
+        norm["source_file"] = pd.Categorical.from_codes(np.full(len(norm), i), categories=names)
+        frames.append(norm)
+        for k in SCHEMA_REPORT_COUNTS:
+            report[k] += rep[k]
+        for pkey, kept in previews.items():
+            if len(rep[pkey]):
+                kept.append(rep[pkey].assign(source_file=name))
+        report["files"].append((name, rep["rows_kept"], rep["dropped"]))
+
+    if not frames:
+        raise ValueError("None of the uploaded files could be read: "
+                         + "; ".join(f"{n} ({e})" for n, e in report["failed"]))
+    for pkey, kept in previews.items():
+        report[pkey] = pd.concat(kept).head(200) if kept else pd.DataFrame()
+    df_batch = concat_normalized(frames)
+    lru_put("dataset_cache", key, (df_batch, report), DATASET_CACHE_MAX_ENTRIES, DATASET_CACHE_MAX_BYTES)
+    return key, df_batch, report
+
+# ---------- Streaming ingestion for very large CSVs ----------
+# Multi-GB exports are read in fixed-size chunks; each chunk is normalized and
+# quality-checked on its own and appended to a compact store, so peak memory is
+# one raw chunk plus the categorical result instead of the whole parsed file.
+STREAM_CHUNK_ROWS = int(os.getenv("VITALVIEW_CHUNK_ROWS", "250000"))
+STREAM_THRESHOLD_BYTES = int(os.getenv("VITALVIEW_STREAM_MB", "200")) * 1024 * 1024
+# streamed uploads are scratch files, kept apart from the saved-dataset store so
+# they never show up in list_stored_datasets(); only the newest few are kept
+STREAM_CACHE_DIR = os.getenv("VITALVIEW_STREAM_CACHE", "vitalview_stream_cache")
+STREAM_CACHE_KEEP = int(os.getenv("VITALVIEW_STREAM_CACHE_KEEP", "4"))
+
+
+def _evict_stream_cache(keep_path: str) -> None:
+    """Delete all but the STREAM_CACHE_KEEP newest streamed files (never `keep_path`)."""
+    try:
+        files = [os.path.join(STREAM_CACHE_DIR, f) for f in os.listdir(STREAM_CACHE_DIR)
+                 if f.endswith((".arrow", ".arrow.tmp"))]
+    except OSError:
+        return
+    files.sort(key=os.path.getmtime, reverse=True)
+    stale = [f for f in files if os.path.abspath(f) != os.path.abspath(keep_path)][max(STREAM_CACHE_KEEP - 1, 0):]
+    for f in stale:
+        try:
+            os.remove(f)
+        except OSError:
+            pass   # still open elsewhere (e.g. memory-mapped on Windows); next upload retries
+
+
+def _csv_read_plan(file_obj, chunk_rows: int = None) -> tuple:
+    """
+    Peek at the header: fips and label columns are always parsed as text, and a
+    wide header gets chunks of about chunk_rows cells rather than rows, since each
+    wide row melts into one long row per indicator column. Returns (dtypes, chunksize).
+    """
+    header = pd.read_csv(file_obj, nrows=0).columns
+    file_obj.seek(0)
+    dtypes = {c: str for c in header if str(c).strip().lower() in ("fips", *SCHEMA_LABEL_COLUMNS)}
+    chunk_rows = chunk_rows or STREAM_CHUNK_ROWS
+    if is_wide_header(header):
+        chunk_rows = max(1, chunk_rows // len(header))
+    return dtypes, chunk_rows
+
+
+def _merge_categories(col: pd.Categorical, known: dict, name: str) -> pd.Categorical:
+    """
+    Re-code a chunk's categorical against a running category list (new labels are
+    appended), so every chunk shares one growing dictionary.
+    """
+    cats = known.get(name)
+    if cats is None:
+        known[name] = col.categories
+        return col
+    if col.categories.equals(cats):
+        return col
+    remap = cats.get_indexer(col.categories)
+    unseen = remap < 0
+    if unseen.any():
+        remap[unseen] = np.arange(len(cats), len(cats) + int(unseen.sum()))
+        cats = cats.append(col.categories[unseen])
+        known[name] = cats
+    remap = np.append(remap, -1)
+    return pd.Categorical.from_codes(remap[col.codes], categories=cats)
+
+
+def concat_normalized(frames: list) -> pd.DataFrame:
+    """pd.concat for enforce_schema output that keeps label columns categorical."""
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        return enforce_schema(pd.DataFrame(columns=SCHEMA_COLUMNS))
+    known = {}
+    aligned = []
+    for f in frames:
+        f = f.copy(deep=False)
+        for c in SCHEMA_LABEL_COLUMNS:
+            if c in f.columns and isinstance(f[c].dtype, pd.CategoricalDtype):
+                f[c] = _merge_categories(f[c].array, known, c)
+        aligned.append(f)
+    # earlier frames hold a prefix of the final category lists — widen them so concat keeps the dtype
+    for f in aligned:
+        for c, cats in known.items():
+            if c in f.columns and len(f[c].cat.categories) != len(cats):
+                f[c] = pd.Categorical.from_codes(f[c].cat.codes, categories=cats)
+    return pd.concat(aligned, ignore_index=True)
+
+
+def _stream_arrow_schema():
+    label = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema(
+        [("state", label), ("county", label), ("fips", label), ("year", pa.int32()),
+         ("indicator", label), ("value", pa.float64()), ("unit", label), ("fips_code", pa.int32())],
+        metadata={b"vitalview_schema": str(SCHEMA_VERSION).encode("utf-8")},
+    )
+
+
+def stream_csv_dataset(file_obj, dataset_key: str, progress=None, chunk_rows: int = None) -> tuple:
+    """Chunked CSV ingestion (see _stream_chunks). Returns (df, report)."""
+    file_obj.seek(0)
+    dtypes, chunksize = _csv_read_plan(file_obj, chunk_rows)
+    chunks = pd.read_csv(file_obj, chunksize=chunksize, dtype=dtypes)
+    return _stream_chunks(chunks, file_obj, dataset_key, progress)
+
+
+def stream_json_dataset(file_obj, dataset_key: str, progress=None, chunk_rows: int = None) -> tuple:
+    """Chunked JSON/NDJSON ingestion (see _stream_chunks). Returns (df, report)."""
+    return _stream_chunks(iter_json_chunks(file_obj, chunk_rows), file_obj, dataset_key, progress)
+
+
+def _stream_chunks(chunks, file_obj, dataset_key: str, progress=None) -> tuple:
+    """
+    Each raw chunk goes through enforce_schema plus the profile's issue checks
+    (negatives, year span, duplicates via 64-bit DUPLICATE_KEY hashes, as in the
+    profile) and is appended to an Arrow file in STREAM_CACHE_DIR, which is
+    memory-mapped back at the end;
+    without pyarrow the compact chunks are kept in memory instead. Only the
+    VitalView columns (plus fips_code) are kept. Returns (df, report).
+    """
+    total_bytes = max(int(getattr(file_obj, "size", 0) or len(file_obj.getvalue())), 1)
+
+    report = {**dict.fromkeys(SCHEMA_REPORT_COUNTS, 0),
+              "chunks": 0, "negatives": 0, "year_min": None, "year_max": None}
+    previews = {p: [] for p in SCHEMA_REPORT_PREVIEWS}
+    hashes, parts, known = [], [], {}
+    source_rows = 0   # raw rows read so far; rows_in counts long cells for wide input
+    path = writer = sink = None
+    if pa is not None:
+        os.makedirs(STREAM_CACHE_DIR, exist_ok=True)
+        path = _store_path(f"upload_{dataset_key[:16]}", STREAM_CACHE_DIR)
+        sink = pa.OSFile(path + ".tmp", "wb")
+        schema = _stream_arrow_schema()
+        writer = pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    try:
+        for chunk in chunks:
+            rep = {}
+            norm = enforce_schema(chunk, report=rep)[NORMALIZED_COLUMNS]
+            for c in SCHEMA_LABEL_COLUMNS:
+                norm[c] = _merge_categories(norm[c].array, known, c)
+
+            # schema report, offset to whole-file row numbers
+            for pkey, kept in previews.items():
+                if len(rep[pkey]) and sum(len(p) for p in kept) < 200:
+                    prev = rep[pkey].copy()
+                    prev["source_row"] += source_rows
+                    kept.append(prev)
+            for k in SCHEMA_REPORT_COUNTS:
+                report[k] += rep[k]
+            source_rows += len(chunk)
+
+            # profile issue checks, per chunk
+            if not norm.empty:
+                report["negatives"] += int((norm["value"] < 0).sum())
+                y0, y1 = int(norm["year"].min()), int(norm["year"].max())
+                report["year_min"] = y0 if report["year_min"] is None else min(report["year_min"], y0)
+                report["year_max"] = y1 if report["year_max"] is None else max(report["year_max"], y1)
+                hashes.append(key_hashes(norm, DUPLICATE_KEY))
+
+            if writer is not None:
+                writer.write_table(pa.Table.from_pandas(norm, schema=schema, preserve_index=False))
+            else:
+                parts.append(norm)
+            report["chunks"] += 1
+            if progress is not None:
+                progress.progress(min(file_obj.tell() / total_bytes, 1.0),
+                                  text=f"Streaming… {report['rows_in']:,} rows read")
+    finally:
+        if writer is not None:
+            writer.close()
+            sink.close()
+
+    all_hashes = np.concatenate(hashes) if hashes else np.empty(0, dtype="uint64")
+    report["duplicates"] = int(all_hashes.size - np.unique(all_hashes).size)
+    for pkey, kept in previews.items():
+        report[pkey] = pd.concat(kept).head(200) if kept else pd.DataFrame()
+
+    if path is not None:
+        os.replace(path + ".tmp", path)
+        _evict_stream_cache(path)
+        df_stream, _ = _read_store_file(path)
+    else:
+        df_stream = concat_normalized(parts)
+    if progress is not None:
+        progress.progress(1.0, text=f"Loaded {report['rows_kept']:,} rows in {report['chunks']} chunk(s)")
+    return df_stream, report
+
 # ----------------------------
 # Sidebar: About + Data
 # ----------------------------
@@ -1259,11 +2691,30 @@ demo_mode = st.sidebar.checkbox("🧪 Demo Mode (sample data)", value=True)
 # ----------------------------
 st.sidebar.header("Data")
 
-uploaded = st.sidebar.file_uploader(
-    "Upload data (CSV or Excel)",
-    type=["csv", "xlsx", "xls", "xlsm", "ods"],
-    accept_multiple_files=False,
+uploaded_files = st.sidebar.file_uploader(
+    "Upload data (CSV, Excel, JSON/NDJSON, or .zip — multiple files OK)",
+    type=["csv", "xlsx", "xls", "xlsm", "ods", "json", "ndjson", "jsonl", "zip"],
+    accept_multiple_files=True,
     key="data_upload_main"
+) or []
+# one plain file → single-file path; several files or a zip → batch ingestion
+uploaded = uploaded_files[0] if len(uploaded_files) == 1 and not uploaded_files[0].name.lower().endswith(".zip") else None
+
+excel_sheet = 0
+if uploaded is not None and uploaded.name.lower().endswith(EXCEL_EXTS):
+    try:
+        sheet_names = excel_sheet_names(uploaded)
+    except Exception:
+        sheet_names = []
+    if len(sheet_names) > 1:
+        excel_sheet = st.sidebar.selectbox("Sheet", sheet_names, key="data_excel_sheet")
+
+stream_mode = st.sidebar.checkbox(
+    "⚡ Large-file streaming mode (CSV / JSON)",
+    value=False,
+    key="data_stream_mode",
+    help=f"Reads the CSV/NDJSON in chunks so memory stays bounded. Turns on automatically above "
+         f"{STREAM_THRESHOLD_BYTES // (1024 * 1024)} MB."
 )
 
 sheet_url = st.sidebar.text_input(
@@ -1273,240 +2724,607 @@ sheet_url = st.sidebar.text_input(
     key="data_gsheet_url"
 )
 
-use_sample = demo_mode and (uploaded is None) and (not sheet_url.strip())
+STORED_DATASETS = list_stored_datasets()
+stored_sel = st.sidebar.selectbox(
+    "…or open a saved dataset",
+    ["(none)"] + STORED_DATASETS,
+    key="data_store_open"
+) if STORED_DATASETS else "(none)"
+
+use_sample = demo_mode and not uploaded_files and (not sheet_url.strip()) and stored_sel == "(none)"
+
+# DATASET_KEY identifies the loaded data for every downstream cache;
+# SCHEMA_REPORT records the rows enforce_schema dropped and why.
+SAMPLE_DATASET_KEY = f"sample-v{SCHEMA_VERSION}"
+DATASET_KEY = SAMPLE_DATASET_KEY
+SCHEMA_REPORT = {}
 
 if use_sample:
     st.sidebar.caption("Using demo sample data.")
-    df = enforce_schema(_make_sample_simple())
+    df = enforce_schema(_make_sample_simple(), report=SCHEMA_REPORT)
 else:
     try:
         if uploaded is not None:
-            raw_df = load_any_table(uploaded)
+            DATASET_KEY, df, SCHEMA_REPORT = load_dataset(uploaded, stream=stream_mode, sheet=excel_sheet)
             st.sidebar.success(f"Loaded file: {uploaded.name}")
+            if "chunks" in SCHEMA_REPORT:
+                st.sidebar.caption(
+                    f"Streamed {SCHEMA_REPORT['rows_in']:,} rows in {SCHEMA_REPORT['chunks']} chunk(s) — "
+                    f"{SCHEMA_REPORT['duplicates']:,} duplicate(s), {SCHEMA_REPORT['negatives']:,} negative value(s)."
+                )
+        elif uploaded_files:
+            DATASET_KEY, df, SCHEMA_REPORT = load_batch(uploaded_files)
+            st.sidebar.success(f"Loaded {len(SCHEMA_REPORT['files'])} file(s) as one dataset.")
+            for name, err in SCHEMA_REPORT["failed"]:
+                st.sidebar.warning(f"Skipped {name}: {err}")
         elif sheet_url.strip():
-            raw_df = load_google_sheet(sheet_url.strip())
+            DATASET_KEY, df, SCHEMA_REPORT = load_sheet_dataset(sheet_url.strip())
             st.sidebar.success("Loaded Google Sheet.")
+        elif stored_sel != "(none)":
+            DATASET_KEY, df, SCHEMA_REPORT = load_dataset_store(stored_sel)
+            st.sidebar.success(f"Opened saved dataset: {stored_sel}")
         else:
             # If user turned off demo but didn't provide data, fall back safely
             st.sidebar.warning("No file or Google Sheet provided — using sample data.")
-            raw_df = _make_sample_simple()
-
-        df = enforce_schema(raw_df)
+            df = enforce_schema(_make_sample_simple(), report=SCHEMA_REPORT)
     except Exception as e:
         st.sidebar.error(f"Couldn't read that file/link: {e}")
         st.sidebar.info("Falling back to sample data so the app still runs.")
-        df = enforce_schema(_make_sample_simple())
-# ---------- Flexible loaders: CSV, Excel, Google Sheets ----------
+        DATASET_KEY = SAMPLE_DATASET_KEY
+        SCHEMA_REPORT = {}
+        df = enforce_schema(_make_sample_simple(), report=SCHEMA_REPORT)
+
+# Save the current (non-sample) dataset to the columnar store for fast reopening
+if pa is not None and DATASET_KEY != SAMPLE_DATASET_KEY and not DATASET_KEY.startswith("store:"):
+    with st.sidebar.expander("💾 Save to dataset store"):
+        store_name = st.text_input(
+            "Dataset name",
+            value=(os.path.splitext(uploaded_files[0].name)[0] if len(uploaded_files) == 1
+                   else "batch_upload" if uploaded_files else "google_sheet"),
+            key="data_store_name"
+        )
+        if st.button("Save dataset", key="data_store_save"):
+            try:
+                save_dataset_store(df, store_name)
+                st.success("Saved. Reopen it from “open a saved dataset” next session.")
+            except Exception as e:
+                st.error(f"Could not save dataset: {e}")
+
+# Append a refresh file (e.g. one new year) to an opened saved dataset
+if pa is not None and DATASET_KEY.startswith("store:"):
+    with st.sidebar.expander("➕ Add / update rows"):
+        st.caption("Rows matching an existing county (FIPS, or state + county when FIPS is blank) + year + indicator replace it; new ones are appended.")
+        update_file = st.file_uploader(
+            "Update file (CSV, Excel, JSON)",
+            type=["csv", "xlsx", "xls", "xlsm", "ods", "json", "ndjson", "jsonl"],
+            key="data_store_update"
+        )
+        if update_file is not None and st.button("Apply update", key="data_store_apply"):
+            try:
+                _, update_df, _ = load_dataset(update_file)
+                counts = upsert_dataset_store(stored_sel, update_df)
+                st.success(f"Updated {stored_sel}: {counts['replaced']:,} replaced, {counts['added']:,} added. "
+                           "The dashboard picks it up on the next interaction.")
+            except Exception as e:
+                st.error(f"Could not apply update: {e}")
+# ---------- Data summary & quality checks ----------
+# Everything the Overview shows (summary, issues, flagged rows, schema hints)
+# comes from one profiling pass over the data, cached per dataset key.
+# Per-row flags are a uint8 bitmask:
+FLAG_MISSING_VALUE = 1
+FLAG_NEGATIVE = 2
+FLAG_MISSING_YEAR = 4
+FLAG_DUPLICATE = 8
+FLAG_CONFLICT = 16
+FLAG_OUTLIER = 32
+FLAG_YOY_JUMP = 64
+FLAG_RULE = 128
+FLAG_LABELS = {
+    FLAG_MISSING_VALUE: "Missing value",
+    FLAG_NEGATIVE: "Negative value",
+    FLAG_MISSING_YEAR: "Missing year",
+    FLAG_DUPLICATE: "Duplicate row",
+    FLAG_CONFLICT: "Conflicting duplicate",
+    FLAG_OUTLIER: "Outlier for indicator/year",
+    FLAG_YOY_JUMP: "Year-over-year jump",
+    FLAG_RULE: "Failed validation rule",
+}
+PROFILE_CACHE_MAX_ENTRIES = 4
+# Outlier thresholds (per indicator + year, and per county series)
+OUTLIER_MIN_GROUP = 5      # smaller indicator/year groups aren't tested
+OUTLIER_MAD_Z = 3.5        # |0.6745·(x − median) / MAD| above this is an outlier
+OUTLIER_IQR_K = 3.0        # … as is anything beyond Q1 − k·IQR / Q3 + k·IQR
+YOY_JUMP_K = 6.0           # change vs. prior year > k × the indicator's median |change|
 
-def load_any_table(file_obj: "UploadedFile") -> pd.DataFrame:
+
+def detect_outliers(df: pd.DataFrame) -> dict:
     """
-    Read a CSV or Excel-like file from the Streamlit uploader.
-    Supports: .csv, .xlsx, .xls, .xlsm, .ods
+    Vectorized outlier checks on the value column:
+      outlier  — robust z (median/MAD) or IQR fences within its indicator + year
+      yoy_jump — change from the same county's previous year far beyond the
+                 indicator's typical year-over-year change
+    Group stats are computed once per group and broadcast back by group id.
+    Returns the two boolean masks plus the per-group stats table.
     """
-    name = file_obj.name.lower()
+    n = len(df)
+    none = np.zeros(n, dtype=bool)
+    if n == 0 or not {"indicator", "year", "value"} <= set(df.columns):
+        return {"outlier": none, "yoy_jump": none, "group_stats": pd.DataFrame()}
+    value = df["value"].to_numpy(dtype="float64")
+
+    # --- robust spread per indicator + year ---
+    gid, _ = pd.factorize(row_keys(df, ["indicator", "year"]))
+    vals = pd.Series(value)
+    grouped = vals.groupby(gid)
+    quart = grouped.quantile([0.25, 0.75]).unstack()
+    stats = pd.DataFrame({"n": grouped.count(), "median": grouped.median(), "q1": quart[0.25], "q3": quart[0.75]})
+    med = stats["median"].to_numpy()[gid]
+    stats["mad"] = pd.Series(np.abs(value - med)).groupby(gid).median()
+
+    mad = stats["mad"].to_numpy()[gid]
+    q1, q3 = stats["q1"].to_numpy()[gid], stats["q3"].to_numpy()[gid]
+    iqr = q3 - q1
+    tested = stats["n"].to_numpy()[gid] >= OUTLIER_MIN_GROUP
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mad_out = (mad > 0) & (np.abs(0.6745 * (value - med) / mad) > OUTLIER_MAD_Z)
+    iqr_out = (iqr > 0) & ((value < q1 - OUTLIER_IQR_K * iqr) | (value > q3 + OUTLIER_IQR_K * iqr))
+    outlier = tested & (mad_out | iqr_out)
+
+    # --- year-over-year jumps within each county's indicator series ---
+    yoy_jump = none
+    if {"state", "county"} <= set(df.columns):
+        series = row_keys(df, ["state", "county", "indicator"])
+        order = np.lexsort((df["year"].to_numpy(), series))
+        s_sorted, v_sorted = series[order], value[order]
+        same = np.r_[False, s_sorted[1:] == s_sorted[:-1]]
+        change = np.where(same, np.abs(v_sorted - np.r_[np.nan, v_sorted[:-1]]), np.nan)
+        ind_codes, _ = pd.factorize(row_keys(df, ["indicator"])[order])
+        typical = pd.Series(change).groupby(ind_codes).median().reindex(range(ind_codes.max() + 1)).to_numpy()[ind_codes]
+        jump_sorted = same & (typical > 0) & (change > YOY_JUMP_K * typical)
+        yoy_jump = np.empty(n, dtype=bool)
+        yoy_jump[order] = jump_sorted
+
+    labels = df[["indicator", "year"]].iloc[pd.Series(np.arange(n)).groupby(gid).first().to_numpy()]
+    stats.index = pd.MultiIndex.from_arrays([labels["indicator"].astype(str).to_numpy(), labels["year"].to_numpy()],
+                                            names=["indicator", "year"])
+    return {"outlier": outlier, "yoy_jump": yoy_jump, "group_stats": stats.sort_index()}
+
+
+# ---------- Validation rules (declarative, vectorized) ----------
+# Checks are data, in the same {"rules": [...]} shape as the recommender rules, so
+# partners can add their own as JSON. Each rule tests one column, optionally only
+# on rows matching "where"; string predicates run on the distinct values (categories)
+# and are broadcast back through the codes. Severity: error | warning | info.
+VALIDATION_RULES = {
+    "rules": [
+        {"name": "No negative values", "column": "value", "check": {">=": 0}, "severity": "warning",
+         "message": "Some indicator values are negative. Check those rows to confirm they’re valid (e.g., not a coding error)."},
+        {"name": "Percentages between 0 and 100", "column": "value", "check": {">=": 0, "<=": 100},
+         "where": {"indicator": {"matches": r"\(%\)\s*$"}}, "severity": "error",
+         "message": "Percentage indicators (e.g. Uninsured (%)) must be between 0 and 100."},
+        {"name": "FIPS is 5 digits", "column": "fips", "check": {"matches": r"^\d{5}$"}, "severity": "warning",
+         "message": "County FIPS codes should be 5 digits (state + county, zero-padded). Codes that aren't are kept as typed."},
+        {"name": "One unit per indicator", "column": "unit", "check": {"consistent_by": "indicator"},
+         "severity": "warning",
+         "message": "Some indicators are reported in more than one unit; the less common unit rows are flagged."},
+        {"name": "Year span of 3+ years", "column": "year", "check": {"span_at_least": 3}, "severity": "info",
+         "message": "Year range is very narrow. Trend lines may be less meaningful; consider adding more years if available."},
+    ]
+}
+RULE_SEVERITIES = ("error", "warning", "info")
+RULE_ROW_OPS = {">=", "<=", ">", "<", "==", "!=", "in", "not_in", "matches", "not_null", "consistent_by"}
+RULE_DATASET_OPS = {"span_at_least"}
+RULE_NUMERIC_OPS = {">=", "<=", ">", "<", "span_at_least"}
+RULE_COMPARE = {">=": operator.ge, "<=": operator.le, ">": operator.gt, "<": operator.lt,
+                "==": operator.eq, "!=": operator.ne}
+
+
+def _check_operands(i: int, check: dict) -> None:
+    """Reject operands that would only fail at evaluation time (ValueError naming rule `i`)."""
+    for op, arg in check.items():
+        if op in RULE_NUMERIC_OPS and (isinstance(arg, bool) or not isinstance(arg, (int, float))):
+            raise ValueError(f"Rule {i}: '{op}' needs a number, got {arg!r}.")
+        if op in ("matches", "consistent_by") and not isinstance(arg, str):
+            raise ValueError(f"Rule {i}: '{op}' needs a string, got {arg!r}.")
+        if op == "matches":
+            try:
+                re.compile(arg)
+            except re.error as e:
+                raise ValueError(f"Rule {i}: invalid 'matches' pattern {arg!r} ({e}).") from None
+
+
+def compile_rules(spec) -> list:
+    """
+    Validate a rules spec ({"rules": [...]} or a bare list) and return the rule
+    list with defaults filled in. Raises ValueError describing the first bad rule.
+    """
+    rules = spec.get("rules") if isinstance(spec, dict) else spec
+    if not isinstance(rules, list):
+        raise ValueError('Rules must be a list or {"rules": [...]}.')
+    compiled = []
+    for i, rule in enumerate(rules, start=1):
+        if not isinstance(rule, dict) or "column" not in rule or not isinstance(rule.get("check"), dict):
+            raise ValueError(f"Rule {i}: needs a 'column' and a 'check' object.")
+        ops = set(rule["check"])
+        unknown = ops - RULE_ROW_OPS - RULE_DATASET_OPS
+        if unknown:
+            raise ValueError(f"Rule {i}: unknown check(s) {sorted(unknown)}.")
+        if ops & RULE_DATASET_OPS and ops - RULE_DATASET_OPS:
+            raise ValueError(f"Rule {i}: dataset checks (span_at_least) can't be mixed with row checks.")
+        _check_operands(i, rule["check"])
+        where = rule.get("where") or {}
+        if not isinstance(where, dict):
+            raise ValueError(f"Rule {i}: 'where' must be an object of column: condition.")
+        for cond in where.values():
+            if isinstance(cond, dict):
+                if set(cond) - RULE_ROW_OPS:
+                    raise ValueError(f"Rule {i}: unknown where check(s) {sorted(set(cond) - RULE_ROW_OPS)}.")
+                _check_operands(i, cond)
+        severity = str(rule.get("severity", "warning")).lower()
+        if severity not in RULE_SEVERITIES:
+            raise ValueError(f"Rule {i}: severity must be one of {', '.join(RULE_SEVERITIES)}.")
+        compiled.append({
+            "name": str(rule.get("name") or f"Rule {i}"),
+            "column": str(rule["column"]).strip().lower(),
+            "check": dict(rule["check"]),
+            "where": {str(k).strip().lower(): v for k, v in where.items()},
+            "severity": severity,
+            "message": str(rule.get("message") or ""),
+        })
+    return compiled
 
-    if name.endswith(".csv"):
-        return pd.read_csv(file_obj)
 
-    if name.endswith((".xlsx", ".xls", ".xlsm", ".ods")):
-        return pd.read_excel(file_obj)
+def rules_fingerprint(rules: list) -> str:
+    return dataset_fingerprint(json.dumps(rules, sort_keys=True, default=str).encode("utf-8"))
 
-    # Fallback: try CSV as a last resort
-    return pd.read_csv(file_obj)
 
+def _coded(df: pd.DataFrame, col: str, cache: dict) -> tuple:
+    """(codes, distinct values) for a column, computed once per validation run."""
+    if col not in cache:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            cache[col] = (s.cat.codes.to_numpy(), pd.Index(s.cat.categories))
+        else:
+            codes, uniques = pd.factorize(s)
+            cache[col] = (codes, pd.Index(uniques))
+    return cache[col]
+
+
+def _rule_ok_mask(df: pd.DataFrame, col: str, check: dict, cache: dict) -> np.ndarray:
+    """True where a row passes every operator in `check` (missing values pass, except for not_null)."""
+    n = len(df)
+    ok = np.ones(n, dtype=bool)
+    numeric = pd.api.types.is_numeric_dtype(df[col].dtype)
+    for op, arg in check.items():
+        if op == "consistent_by":
+            codes, cats = _coded(df, col, cache)
+            gcodes, gcats = _coded(df, str(arg).strip().lower(), cache)
+            width = len(cats) + 1
+            pair = (gcodes.astype("int64") + 1) * width + (codes.astype("int64") + 1)
+            counts = np.bincount(pair, minlength=(len(gcats) + 1) * width).reshape(-1, width)
+            counts[:, 0] = 0                          # missing units don't count as a variant
+            mode = counts.argmax(axis=1)
+            n_variants = (counts > 0).sum(axis=1)
+            g = gcodes.astype("int64") + 1
+            ok &= (n_variants[g] <= 1) | (codes.astype("int64") + 1 == mode[g]) | (codes < 0)
+            continue
+        if op == "not_null":
+            ok &= df[col].notna().to_numpy() if arg else True
+            continue
+        if numeric and op in RULE_COMPARE and (op in RULE_NUMERIC_OPS or isinstance(arg, (int, float))):
+            v = df[col].to_numpy(dtype="float64")
+            with np.errstate(invalid="ignore"):
+                ok &= RULE_COMPARE[op](v, arg) | np.isnan(v)
+            continue
+        # string-style predicates: evaluate on distinct values, broadcast through codes
+        codes, cats = _coded(df, col, cache)
+        labels = cats.astype(str)
+        if op == "matches":
+            pattern = re.compile(arg)     # Python regex on the distinct labels, same engine compile_rules checked
+            cat_ok = np.fromiter((pattern.search(x) is not None for x in labels), dtype=bool, count=len(labels))
+        elif op in ("in", "not_in"):
+            allowed = [str(a) for a in (arg if isinstance(arg, (list, tuple, set)) else [arg])]
+            cat_ok = labels.isin(allowed)
+            cat_ok = cat_ok if op == "in" else ~cat_ok
+        elif op in ("==", "!="):
+            cat_ok = labels == str(arg) if op == "==" else labels != str(arg)
+        else:
+            num = np.asarray(pd.to_numeric(labels, errors="coerce"), dtype="float64")
+            with np.errstate(invalid="ignore"):
+                cat_ok = RULE_COMPARE[op](num, arg) | np.isnan(num)
+        ok &= np.append(np.asarray(cat_ok, dtype=bool), True)[codes]   # code -1 (missing) passes
+    return ok
 
-def load_google_sheet(url: str) -> pd.DataFrame:
-    """
-    Read a public Google Sheet by turning it into a CSV export link.
 
-    - Works if the sheet is 'Anyone with the link can view'
-    - URL examples it supports:
-      * .../edit#gid=0
-      * .../edit?usp=sharing
-      * .../view...
+def run_validation(df: pd.DataFrame, rules: list) -> list:
     """
-    url = url.strip()
-
-    if "docs.google.com" not in url:
-        raise ValueError("That doesn't look like a Google Sheets URL.")
+    Evaluate compiled rules in one pass over the frame (column codes are shared
+    across rules). Returns one result per rule:
+      {name, severity, message, failed (row count, or 1/0 for dataset checks), rows (int32 positions)}
+    Rules naming a column the data doesn't have (including a consistent_by group)
+    are skipped. A rule that still fails to evaluate is reported with an "error"
+    string and no flagged rows, so one bad custom rule can't stop the app.
+    """
+    cache, results = {}, []
+    for rule in rules:
+        col, check = rule["column"], rule["check"]
+        conds = [check] + [c for c in rule["where"].values() if isinstance(c, dict)]
+        needed = [col, *rule["where"], *(str(c["consistent_by"]).strip().lower() for c in conds if "consistent_by" in c)]
+        if any(c not in df.columns for c in needed):
+            continue
+        try:
+            if set(check) <= RULE_DATASET_OPS:
+                years = pd.to_numeric(df[col], errors="coerce").dropna()
+                failed = int(not years.empty and years.max() - years.min() < check["span_at_least"])
+                results.append({**rule, "failed": failed, "rows": np.zeros(0, dtype="int32")})
+                continue
+            applies = np.ones(len(df), dtype=bool)
+            for wcol, cond in rule["where"].items():
+                applies &= _rule_ok_mask(df, wcol, cond if isinstance(cond, dict)
+                                         else {"in": cond} if isinstance(cond, list) else {"==": cond}, cache)
+            bad = applies & ~_rule_ok_mask(df, col, check, cache)
+        except Exception as e:
+            results.append({**rule, "failed": 0, "rows": np.zeros(0, dtype="int32"), "error": f"{type(e).__name__}: {e}"})
+            continue
+        rows = np.flatnonzero(bad).astype("int32" if len(df) < 2**31 else "int64")
+        results.append({**rule, "failed": int(rows.size), "rows": rows})
+    return results
 
-    # Basic transformation: strip anything after '/edit' or '/view' and add export
-    base = url
-    for marker in ["/edit", "/view"]:
-        if marker in base:
-            base = base.split(marker)[0]
-            break
 
-    csv_url = base.rstrip("/") + "/export?format=csv"
+def active_validation_rules() -> list:
+    """Built-in rules plus any uploaded in this session (same name replaces a built-in)."""
+    custom = st.session_state.get("validation_rules_custom") or []
+    names = {r["name"] for r in custom}
+    return [r for r in compile_rules(VALIDATION_RULES) if r["name"] not in names] + custom
 
-    return pd.read_csv(csv_url)
 
-# If demo mode is on and no file uploaded → use the sample data
-use_sample = demo_mode and (uploaded is None)
+def _indicator_stats_frame(n, s, s2, nulls, names) -> pd.DataFrame:
+    n = np.asarray(n, dtype="float64")
+    s = np.asarray(s, dtype="float64")
+    s2 = np.asarray(s2, dtype="float64")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s / n
+        std = np.sqrt(np.maximum(s2 - s * mean, 0.0) / (n - 1))
+    return pd.DataFrame({"rows": n.astype("int64"), "missing": np.asarray(nulls, dtype="int64"),
+                         "mean": mean, "std": np.where(n > 1, std, np.nan)},
+                        index=pd.Index(names, name="indicator", dtype=object)).sort_index()
 
-if use_sample:
-    df = enforce_schema(_make_sample_simple())
-else:
-    df = load_any_file(uploaded) if uploaded is not None else enforce_schema(_make_sample_simple())
-# ---------- Data summary & quality checks ----------
-def summarize_data(df: pd.DataFrame) -> dict:
-    """Quick summary for the homepage."""
-    if df is None or df.empty:
-        return {
-            "rows": 0,
-            "years": (None, None),
-            "n_counties": 0,
-            "n_indicators": 0,
-            "missing_values": 0,
-        }
 
-    years = df["year"].dropna() if "year" in df.columns else pd.Series([], dtype="float")
-    years_min = int(years.min()) if not years.empty else None
-    years_max = int(years.max()) if not years.empty else None
-
-    return {
-        "rows": int(len(df)),
-        "years": (years_min, years_max),
-        "n_counties": int(df["county"].nunique()) if "county" in df.columns else 0,
-        "n_indicators": int(df["indicator"].nunique()) if "indicator" in df.columns else 0,
-        "missing_values": int(df.isna().sum().sum()),
-    }
-
-
-def find_data_issues(df: pd.DataFrame) -> list:
-    """Return human-readable data quality issues / cleaning tips."""
+def _profile_issues(p: dict) -> list:
+    """Human-readable data quality issues / cleaning tips from a profile."""
     issues = []
-
-    if df is None or df.empty:
+    if p["summary"]["rows"] == 0:
         issues.append("No data loaded. Turn on Demo Mode or upload a file to begin exploring.")
         return issues
 
-    # Required columns present?
-    required = ["state", "county", "fips", "year", "indicator", "value", "unit"]
-    missing_cols = [c for c in required if c not in df.columns]
-    if missing_cols:
+    if p["missing_cols"]:
         issues.append(
             "Missing required columns: "
-            + ", ".join(missing_cols)
+            + ", ".join(p["missing_cols"])
             + ". Make sure your file includes all standard VitalView fields."
         )
-
-    # Duplicate rows
-    dup_count = int(df.duplicated().sum())
-    if dup_count > 0:
+    if p["duplicates"] > 0:
         issues.append(
-            f"{dup_count:,} duplicate row(s) detected. Consider removing duplicates before final analysis."
+            f"{p['duplicates']:,} duplicate row(s) detected. Consider removing duplicates before final analysis."
         )
-
-    # Negative values (often suspicious for these indicators)
-    if "value" in df.columns and (df["value"] < 0).any():
+    if p.get("conflict_keys"):
         issues.append(
-            "Some indicator values are negative. Check those rows to confirm they’re valid (e.g., not a coding error)."
+            f"{p['conflict_keys']:,} {' + '.join(c.replace('county_key', 'county') for c in DUPLICATE_KEY)} combination(s) appear with different values. "
+            "Pivots average the values per county, indicator and year — pick the correct one before exporting."
         )
-
-    # Narrow year span
-    if "year" in df.columns:
-        years = df["year"].dropna()
-        if not years.empty and years.max() - years.min() < 3:
-            issues.append(
-                "Year range is very narrow. Trend lines may be less meaningful; consider adding more years if available."
-            )
-
-    # Missing values by indicator
-    if "indicator" in df.columns and "value" in df.columns:
-        null_by_ind = df[df["value"].isna()].groupby("indicator").size()
-        for ind, cnt in null_by_ind.items():
+    if p["flag_counts"].get(FLAG_OUTLIER):
+        issues.append(
+            f"{p['flag_counts'][FLAG_OUTLIER]:,} value(s) are statistical outliers for their indicator and year "
+            "(far outside the median/IQR range). Check them in Flagged Rows."
+        )
+    if p["flag_counts"].get(FLAG_YOY_JUMP):
+        issues.append(
+            f"{p['flag_counts'][FLAG_YOY_JUMP]:,} value(s) jump sharply from the same county’s previous year. "
+            "These are often unit or entry errors."
+        )
+    for res in sorted(p["validation"], key=lambda r: RULE_SEVERITIES.index(r["severity"])):
+        if res.get("error"):
+            issues.append(f"Validation rule “{res['name']}” couldn't be checked ({res['error']}). Fix or remove it in the rules file.")
+            continue
+        if not res["failed"]:
+            continue
+        text = res["message"] or f"Failed validation rule “{res['name']}”."
+        issues.append(text if not res["rows"].size else f"{res['failed']:,} row(s) — {text}")
+    for ind, cnt in p["indicator_stats"]["missing"].items():
+        if cnt:
             issues.append(
                 f"{cnt} record(s) for '{ind}' are missing values. You may want to impute or drop these before exporting."
             )
-
     return issues
 
 
-# Pre-computed summary + issues, reused on the homepage
-DATA_SUMMARY = summarize_data(df)
-DATA_ISSUES = find_data_issues(df)
-# ---------- Flagged rows + schema / documentation helpers ----------
+def _profile_hints(p: dict) -> list:
+    """'Variable finder' style hints about how the dataset is structured."""
+    hints = []
+    if p["summary"]["rows"] == 0:
+        hints.append("No data loaded yet. Turn on Demo Mode or upload a file to see structure hints.")
+        return hints
 
-def compute_flagged_rows(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Build a small table of 'flagged' rows:
-    - missing values
-    - negative values
-    - duplicate rows
-    - weird years
-    """
-    if df is None or df.empty:
-        return pd.DataFrame()
+    if p["extra_cols"]:
+        hints.append("Extra columns detected: " + ", ".join(p["extra_cols"]) + ". These can be useful but may need documentation.")
+    if p["missing_cols"]:
+        hints.append("Missing standard VitalView columns: " + ", ".join(p["missing_cols"]) + ".")
 
-    work = df.copy()
-    work["flag_reason"] = ""
+    inds = sorted(p["indicator_stats"].index.astype(str))
+    if not inds:
+        hints.append("No indicator names found. Check that your 'indicator' column is populated.")
+    else:
+        hints.append(f"{len(inds)} unique indicators found. Examples: " + "; ".join(inds[:8]) + ("..." if len(inds) > 8 else ""))
 
-    # Missing numeric value
-    if "value" in work.columns:
-        mask_missing = work["value"].isna()
-        work.loc[mask_missing, "flag_reason"] += "Missing value; "
+    yr_min, yr_max = p["summary"]["years"]
+    if yr_min is not None:
+        hints.append(f"Year coverage: {yr_min}–{yr_max} ({p['n_years']} distinct year(s)).")
+    else:
+        hints.append("No valid year values found. Make sure 'year' is numeric.")
+    return hints
 
-        # Negative values (often suspicious)
-        mask_neg = work["value"] < 0
-        work.loc[mask_neg, "flag_reason"] += "Negative value; "
 
-    # Year issues
-    if "year" in work.columns:
-        bad_year = work["year"].isna()
-        work.loc[bad_year, "flag_reason"] += "Missing year; "
+def profile_dataset(df: pd.DataFrame, dataset_key: str = None, stats: dict = None, rules: list = None) -> dict:
+    """
+    One vectorized pass over a normalized frame → profile dict with
+      summary, issues, hints  homepage summary, data-quality issues, structure hints
+      flags                   uint8 bitmask per row (FLAG_*), flag_counts per bit
+      indicator_stats         rows / missing / mean / std per indicator
+      outlier_stats           n / median / MAD / quartiles per indicator + year
+      validation              run_validation results for `rules` (default: the built-in rules)
+    Cached per dataset_key and rule set. Counts come from `stats` (or the cached upsert/store
+    stats for the key) when available; the flags always need the row scan.
+    """
+    rules = compile_rules(VALIDATION_RULES) if rules is None else rules
+    cache_key = (dataset_key, rules_fingerprint(rules))
+    if dataset_key is not None:
+        cached = lru_get("data_profile", cache_key)
+        if cached is not None:
+            return cached
+        if stats is None:
+            stats = lru_get("dataset_stats", dataset_key)
+
+    df = df if df is not None else pd.DataFrame(columns=SCHEMA_COLUMNS)
+    n = len(df)
+    p = {
+        "missing_cols": [c for c in SCHEMA_COLUMNS if c not in df.columns],
+        "extra_cols": [c for c in df.columns if c not in NORMALIZED_COLUMNS],
+    }
 
-    # Duplicate rows
-    dup_mask = work.duplicated()
-    work.loc[dup_mask, "flag_reason"] += "Duplicate row; "
+    # --- row flags ---
+    value = df["value"].to_numpy(dtype="float64") if "value" in df.columns else np.full(n, np.nan)
+    year = df["year"] if "year" in df.columns else pd.Series(np.full(n, np.nan))
+    missing_value = np.isnan(value)
+    missing_year = year.isna().to_numpy()
+    negative = value < 0
+    dups = find_duplicates(df)
+    outliers = detect_outliers(df)
+    p["validation"] = run_validation(df, rules)
+    rule_fail = np.zeros(n, dtype=bool)
+    for res in p["validation"]:
+        if res["severity"] != "info":
+            rule_fail[res["rows"]] = True
+    flags = (missing_value * np.uint8(FLAG_MISSING_VALUE) | negative * np.uint8(FLAG_NEGATIVE)
+             | missing_year * np.uint8(FLAG_MISSING_YEAR) | dups["duplicate"] * np.uint8(FLAG_DUPLICATE)
+             | dups["conflict"] * np.uint8(FLAG_CONFLICT) | outliers["outlier"] * np.uint8(FLAG_OUTLIER)
+             | outliers["yoy_jump"] * np.uint8(FLAG_YOY_JUMP) | rule_fail * np.uint8(FLAG_RULE)).astype("uint8")
+    p["outlier_stats"] = outliers["group_stats"]
+    p["flags"] = flags
+    # row positions per flag type (int32 while they fit) — lets the viewer page through one type directly
+    idx_dtype = "int32" if n < 2**31 else "int64"
+    p["flag_index"] = {bit: np.flatnonzero(flags & bit).astype(idx_dtype) for bit in FLAG_LABELS}
+    p["flag_counts"] = {bit: int(rows.size) for bit, rows in p["flag_index"].items()}
+    p["negatives"] = p["flag_counts"][FLAG_NEGATIVE]
+    p["duplicates"] = p["flag_counts"][FLAG_DUPLICATE]
+    p["conflict_keys"] = dups["n_conflict_keys"]
+
+    # --- counts + per-indicator stats ---
+    if stats is not None:
+        years = sorted(int(y) for y in stats["year_counts"])
+        n_counties = len(stats["county_counts"])
+        missing_total = stats["missing_values"]
+        names = list(stats["indicators"])
+        cols = np.array([stats["indicators"][k] for k in names], dtype="float64").reshape(-1, 4)
+        p["indicator_stats"] = _indicator_stats_frame(cols[:, 0], cols[:, 1], cols[:, 2], cols[:, 3], names)
+    else:
+        years = np.unique(year.dropna().to_numpy()).astype(int).tolist() if n else []
+        n_counties = int(df["county"].nunique()) if "county" in df.columns else 0
+        missing_total = int(df.isna().sum().sum())
+        if "indicator" in df.columns and n:
+            codes, names = pd.factorize(df["indicator"])
+            ok = ~missing_value & (codes >= 0)
+            v = np.where(ok, value, 0.0)
+            k = len(names)
+            c = np.where(codes >= 0, codes, 0)
+            p["indicator_stats"] = _indicator_stats_frame(
+                np.bincount(c, weights=ok, minlength=k), np.bincount(c, weights=v, minlength=k),
+                np.bincount(c, weights=v * v, minlength=k),
+                np.bincount(c, weights=missing_value & (codes >= 0), minlength=k), names.astype(str))
+        else:
+            p["indicator_stats"] = _indicator_stats_frame([], [], [], [], [])
+    p["n_years"] = len(years)
+    p["summary"] = {
+        "rows": int(n),
+        "years": (years[0], years[-1]) if years else (None, None),
+        "n_counties": n_counties,
+        "n_indicators": int(len(p["indicator_stats"])),
+        "missing_values": int(missing_total),
+    }
+    p["issues"] = _profile_issues(p)
+    p["hints"] = _profile_hints(p)
 
-    flagged = work[work["flag_reason"] != ""].copy()
-    flagged["flag_reason"] = flagged["flag_reason"].str.rstrip("; ").str.strip()
+    if dataset_key is not None:
+        lru_put("data_profile", cache_key, p, PROFILE_CACHE_MAX_ENTRIES)
+    return p
 
-    # Only show a subset of columns so it’s readable
-    keep_cols = [c for c in ["state", "county", "fips", "year", "indicator", "value", "unit", "flag_reason"] if c in flagged.columns]
-    return flagged[keep_cols] if not flagged.empty else pd.DataFrame()
 
+def flag_reasons(flags: np.ndarray) -> np.ndarray:
+    """Human-readable reason per bitmask value ("Missing value; Duplicate row"), via a lookup table."""
+    table = np.array(["; ".join(label for bit, label in FLAG_LABELS.items() if code & bit)
+                      for code in range(256)], dtype=object)
+    return table[np.asarray(flags, dtype="uint8")]
 
-def analyze_structure_hints(df: pd.DataFrame) -> list:
-    """
-    Return 'variable finder' style hints about how the dataset is structured.
-    Not AI, but very helpful.
-    """
-    hints = []
-    if df is None or df.empty:
-        hints.append("No data loaded yet. Turn on Demo Mode or upload a file to see structure hints.")
-        return hints
 
-    required = {"state","county","fips","year","indicator","value","unit"}
-    extra_cols = [c for c in df.columns if c not in required]
-    missing_cols = [c for c in required if c not in df.columns]
-
-    if extra_cols:
-        hints.append("Extra columns detected: " + ", ".join(extra_cols) + ". These can be useful but may need documentation.")
-    if missing_cols:
-        hints.append("Missing standard VitalView columns: " + ", ".join(missing_cols) + ".")
-
-    # Indicator overview
-    if "indicator" in df.columns:
-        inds = sorted(df["indicator"].dropna().unique().tolist())
-        n_inds = len(inds)
-        if n_inds == 0:
-            hints.append("No indicator names found. Check that your 'indicator' column is populated.")
-        else:
-            sample_inds = inds[:8]
-            hints.append(f"{n_inds} unique indicators found. Examples: " + "; ".join(sample_inds) + ("..." if n_inds > 8 else ""))
-
-    # Year coverage
-    if "year" in df.columns:
-        years = df["year"].dropna().unique().tolist()
-        if years:
-            hints.append(f"Year coverage: {int(min(years))}–{int(max(years))} ({len(years)} distinct year(s)).")
-        else:
-            hints.append("No valid year values found. Make sure 'year' is numeric.")
+def flagged_positions(profile: dict, mask: int = None) -> np.ndarray:
+    """Row positions carrying any of the flag bits in `mask` (all flags when None)."""
+    mask = sum(FLAG_LABELS) if mask is None else mask
+    bits = [bit for bit in FLAG_LABELS if mask & bit]
+    if len(bits) == 1:
+        return profile["flag_index"][bits[0]]
+    if not bits:
+        return np.zeros(0, dtype="int64")
+    return np.flatnonzero(profile["flags"] & np.uint8(mask))
 
-    return hints
 
+def flagged_rows(df: pd.DataFrame, profile: dict, limit: int = None, mask: int = None,
+                 start: int = 0) -> pd.DataFrame:
+    """
+    Materialize flagged rows with a flag_reason column — only rows
+    [start, start + limit) of those matching `mask`, so a page costs a page.
+    """
+    idx = flagged_positions(profile, mask)
+    idx = idx[start:] if limit is None else idx[start:start + limit]
+    if idx.size == 0:
+        return pd.DataFrame()
+    keep_cols = [c for c in SCHEMA_COLUMNS if c in df.columns]
+    out = df.iloc[idx][keep_cols].copy()
+    reasons = flag_reasons(profile["flags"][idx])
+    # name the failed rules instead of the generic label (only this page's rows are looked up)
+    failed = [(res["name"], np.isin(idx, res["rows"])) for res in profile.get("validation", [])
+              if res["rows"].size and res["severity"] != "info"]
+    if failed:
+        names = np.array(["; ".join(name for name, hit in failed if hit[i]) for i in range(idx.size)], dtype=object)
+        generic = FLAG_LABELS[FLAG_RULE]
+        reasons = np.array([r.replace(generic, f"Rule: {nm}") if nm else r for r, nm in zip(reasons, names)], dtype=object)
+    out["flag_reason"] = reasons
+    return out
+
+
+# Partner-supplied validation rules (JSON, same shape as VALIDATION_RULES)
+with st.sidebar.expander("🧪 Validation rules"):
+    st.caption("Add checks without code: upload a JSON file of rules. Rules with a built-in's name replace it.")
+    st.download_button(
+        "Download built-in rules (template)",
+        data=json.dumps(VALIDATION_RULES, indent=2, ensure_ascii=False).encode("utf-8"),
+        file_name="vitalview_rules.json",
+        mime="application/json",
+        key="rules_template_dl"
+    )
+    rules_file = st.file_uploader("Rules file (.json)", type=["json"], key="rules_upload")
+    st.session_state["validation_rules_custom"] = []
+    if rules_file is not None:
+        try:
+            st.session_state["validation_rules_custom"] = compile_rules(json.loads(rules_file.getvalue()))
+            st.success(f"Loaded {len(st.session_state['validation_rules_custom'])} rule(s).")
+        except ValueError as e:
+            st.error(f"Rules not loaded: {e}")
+
+# One profiling pass, reused on the homepage & reports
+DATA_PROFILE = profile_dataset(df, DATASET_KEY, rules=active_validation_rules())
+DATA_SUMMARY = DATA_PROFILE["summary"]
+DATA_ISSUES = DATA_PROFILE["issues"]
+DATA_SCHEMA_HINTS = DATA_PROFILE["hints"]
+# ---------- Flagged rows + schema / documentation helpers ----------
 
 def build_data_doc(df: pd.DataFrame, summary: dict, issues: list, schema_hints: list) -> str:
     """
@@ -1558,9 +3376,147 @@ def build_data_doc(df: pd.DataFrame, summary: dict, issues: list, schema_hints:
     return "\n".join(lines)
 
 
-# Pre-computed objects reused on the homepage & reports
-FLAGGED_ROWS = compute_flagged_rows(df)
-DATA_SCHEMA_HINTS = analyze_structure_hints(df)
+
+
+# ---------- Filter index (state → county → year) ----------
+# Rows are ordered once per dataset by (state, county, year), so every county
+# owns a contiguous block of that order and a year range inside it is two
+# binary searches. The sidebar filters then slice instead of rescanning the
+# frame, and their option lists come from the index rather than unique().
+FILTER_INDEX_MAX_ENTRIES = 4
+
+
+def build_filter_index(df: pd.DataFrame, dataset_key: str = None) -> dict:
+    """
+    Returns {"order", "sort_key", "year0", "span", "states", "counties"} where `counties`
+    is indexed by county key (see county_keys), in (state, label) order, with
+    state/county/label, the [start, stop) block of `order` and the year bounds.
+    """
+    if dataset_key is not None:
+        cached = lru_get("filter_index", dataset_key)
+        if cached is not None:
+            return cached
+    keys = county_keys(df)
+    inverse, uniq = pd.factorize(keys)
+    first = np.empty(len(uniq), dtype="int64")
+    first[inverse[::-1]] = np.arange(len(keys) - 1, -1, -1)
+    state = pd.Series(df["state"].to_numpy()[first], dtype=object).fillna("").astype(str).to_numpy()
+    county = pd.Series(df["county"].to_numpy()[first], dtype=object).fillna("").astype(str).to_numpy()
+    label = np.array([f"{c} ({STATE_ABBR.get(s, s)})" for c, s in zip(county, state)], dtype=object)
+    by_rank = np.lexsort((label, state))
+    rank = np.empty(len(uniq), dtype="int64")
+    rank[by_rank] = np.arange(len(uniq))
+
+    # sort key = county rank * span + (year - first year)
+    year = df["year"].to_numpy(dtype="int64")
+    year0 = int(year.min()) if len(year) else 0
+    span = int(year.max()) - year0 + 1 if len(year) else 1
+    sort_key = rank[inverse] * span + (year - year0)
+    order = np.argsort(sort_key)
+    sort_key = sort_key[order]
+
+    ranks = np.arange(len(uniq), dtype="int64")
+    start = np.searchsorted(sort_key, ranks * span)
+    stop = np.searchsorted(sort_key, (ranks + 1) * span)
+    counties = pd.DataFrame({
+        "state": state[by_rank], "county": county[by_rank], "label": label[by_rank],
+        "rank": ranks, "start": start, "stop": stop,
+        "year_min": sort_key[start] % span + year0 if len(uniq) else ranks,
+        "year_max": sort_key[stop - 1] % span + year0 if len(uniq) else ranks,
+    }, index=pd.Index(uniq[by_rank], name="county_key"))
+    index = {
+        "order": order, "sort_key": sort_key, "year0": year0, "span": span,
+        "states": sorted(s for s in pd.unique(state) if s),
+        "counties": counties,
+    }
+    if dataset_key is not None:
+        lru_put("filter_index", dataset_key, index, FILTER_INDEX_MAX_ENTRIES, DATASET_CACHE_MAX_BYTES)
+    return index
+
+
+def _concat_ranges(start: np.ndarray, stop: np.ndarray) -> np.ndarray:
+    """np.concatenate([np.arange(a, b) for a, b in zip(start, stop)]) without the loop."""
+    keep = stop > start
+    start, stop = start[keep], stop[keep]
+    if not len(start):
+        return np.empty(0, dtype="int64")
+    lens = stop - start
+    steps = np.ones(int(lens.sum()), dtype="int64")
+    steps[0] = start[0]
+    steps[np.cumsum(lens)[:-1]] = start[1:] - stop[:-1] + 1
+    return np.cumsum(steps)
+
+
+def filter_positions(index: dict, counties=None, years: tuple = None) -> np.ndarray:
+    """
+    Row positions of the chosen county keys (all when None) within an inclusive
+    (first, last) year range, in (state, county, year) order.
+    """
+    sel = index["counties"] if counties is None else index["counties"].loc[list(counties)]
+    start, stop = sel["start"].to_numpy(), sel["stop"].to_numpy()
+    if years is not None:
+        base = sel["rank"].to_numpy() * index["span"]
+        # clamp to the county's own block: lo ∈ [0, span], hi ∈ [-1, span - 1]
+        lo = min(max(int(years[0]) - index["year0"], 0), index["span"])
+        hi = min(max(int(years[1]) - index["year0"], -1), index["span"] - 1)
+        start = np.searchsorted(index["sort_key"], base + lo, side="left")
+        stop = np.searchsorted(index["sort_key"], base + hi, side="right")
+    return index["order"][_concat_ranges(start, stop)]
+
+
+# ---------- Filtered-view cache ----------
+# Tab switches and slider moves rerun the script with the same filters; the
+# filtered frame is kept per (dataset, normalized selection) so those reruns
+# don't slice the dataset again. Every tab reads the same `dfx`.
+VIEW_CACHE_MAX_ENTRIES = 8
+VIEW_CACHE_MAX_BYTES = DATASET_CACHE_MAX_BYTES // 2
+
+
+def view_key(dataset_key: str, states=(), counties=(), years: tuple = None) -> tuple:
+    """Normalized, hashable form of a filter selection — the key of every per-view cache."""
+    return (dataset_key, tuple(sorted(states)), tuple(sorted(counties)), years)
+
+
+def filtered_view(df: pd.DataFrame, index: dict, key: tuple) -> pd.DataFrame:
+    """
+    The rows of `df` matching a view_key selection (see filter_positions).
+    An empty selection means "all" and returns df itself; treat the result as read-only.
+    """
+    _, states, counties, years = key
+    if not states and not counties and years is None:
+        return df
+    cached = lru_get("filtered_view", key)
+    if cached is not None:
+        return cached
+    chosen = index["counties"]
+    if counties:
+        chosen = chosen.loc[list(counties)]
+    elif states:
+        chosen = chosen[chosen["state"].isin(states)]
+    view = df.take(filter_positions(index, chosen.index, years))
+    return lru_put("filtered_view", key, view, VIEW_CACHE_MAX_ENTRIES, VIEW_CACHE_MAX_BYTES)
+
+
+# ---------- Pivot service (one county × indicator matrix per view) ----------
+# Priority, Map and the Grant Writer all score the same latest-year pivot of the
+# filtered view; it's built once per (view, year) and the same object is shared.
+PIVOT_CACHE_MAX_ENTRIES = 8
+
+
+def view_pivot(view: pd.DataFrame, key: tuple, year="latest") -> tuple:
+    """
+    (year, derive_pivot of the view's rows for that year), cached per view key.
+    year="latest" uses the view's most recent year; None pivots over all years.
+    Returns (None, empty frame) for an empty view. Treat the pivot as read-only.
+    """
+    if view is None or view.empty:
+        return None, pd.DataFrame()
+    cached = lru_get("view_pivot", (key, year))
+    if cached is not None:
+        return cached
+    year_used = int(view["year"].max()) if year == "latest" else year
+    rows = view if year_used is None else view[view["year"].to_numpy() == year_used]
+    return lru_put("view_pivot", (key, year), (year_used, derive_pivot(rows)), PIVOT_CACHE_MAX_ENTRIES)
 
 
 # ----------------------------
@@ -1569,20 +3525,26 @@ DATA_SCHEMA_HINTS = analyze_structure_hints(df)
 left, right = st.columns([1,3])
 with left:
     st.subheader("Filters")
-    states = sorted(df["state"].unique().tolist())
-    state_sel = st.multiselect("Select State(s)", states, default=states[:1])
-    dfx = df[df["state"].isin(state_sel)] if state_sel else df.copy()
-    counties = sorted(dfx["county"].unique().tolist())
-    county_sel = st.multiselect("Select County(ies)", counties)
-    if county_sel: dfx = dfx[dfx["county"].isin(county_sel)]
-    years = sorted(dfx["year"].unique().tolist())
-    if years:
-        y_min, y_max = int(min(years)), int(max(years))
+    fidx = build_filter_index(df, DATASET_KEY)
+    state_sel = st.multiselect("Select State(s)", fidx["states"], default=fidx["states"][:1])
+    # counties are picked by integer key (FIPS code), so same-named counties in
+    # different states stay distinct; county_sel keeps the names for the reports
+    county_opts = fidx["counties"]
+    if state_sel: county_opts = county_opts[county_opts["state"].isin(state_sel)]
+    county_key_sel = st.multiselect("Select County(ies)", county_opts.index.tolist(),
+                                    format_func=county_opts["label"].get)
+    county_sel = county_opts.loc[county_key_sel, "county"].tolist()
+    chosen = county_opts.loc[county_key_sel] if county_key_sel else county_opts
+    year_sel = None
+    if len(chosen):
+        y_min, y_max = int(chosen["year_min"].min()), int(chosen["year_max"].max())
         if y_min != y_max:
-            yr_from, yr_to = st.slider("Year range", y_min, y_max, (y_min, y_max))
-            dfx = dfx[(dfx["year"]>=yr_from)&(dfx["year"]<=yr_to)]
+            year_sel = st.slider("Year range", y_min, y_max, (y_min, y_max))
+            if year_sel == (y_min, y_max): year_sel = None  # full range: no year filter
         else:
             st.caption(f"Year: {y_min}")
+    VIEW_KEY = view_key(DATASET_KEY, state_sel, county_key_sel, year_sel)
+    dfx = filtered_view(df, fidx, VIEW_KEY)
 
 # ----------------------------
 # Tabs
@@ -1605,7 +3567,7 @@ with tab_overview:
             border: 1px solid #0A74DA33;
             margin-bottom: 14px;">
             <span style="font-weight:600;">Step 1 — Add your data.</span><br>
-            • Drag & drop a <b>CSV, Excel, or JSON</b> file into the uploader in the left sidebar<br>
+            • Drag & drop a <b>CSV, Excel, or JSON/NDJSON</b> file into the uploader in the left sidebar<br>
             • Or turn on <b>Demo Mode</b> in the sidebar to explore sample data for Cook, Lake, and Will Counties<br><br>
             <span style="font-size:0.9em;opacity:0.85;">
             VitalView automatically checks your file for required columns, missing values, and basic issues.
@@ -1632,6 +3594,29 @@ with tab_overview:
 
     st.caption(f"Total missing values detected: {DATA_SUMMARY['missing_values']:,}")
 
+    if SCHEMA_REPORT.get("dropped"):
+        st.caption(
+            f"{SCHEMA_REPORT['dropped']:,} of {SCHEMA_REPORT['rows_in']:,} uploaded row(s) were dropped "
+            f"during normalization (invalid year: {SCHEMA_REPORT['bad_year']:,}; "
+            f"non-numeric value: {SCHEMA_REPORT['bad_value']:,})."
+        )
+        with st.expander("Show dropped rows"):
+            st.dataframe(SCHEMA_REPORT["dropped_preview"], use_container_width=True)
+    if SCHEMA_REPORT.get("fips_invalid") or SCHEMA_REPORT.get("fips_mismatch"):
+        st.caption(
+            f"FIPS check: {SCHEMA_REPORT['fips_invalid']:,} row(s) with an invalid code and "
+            f"{SCHEMA_REPORT['fips_mismatch']:,} whose code doesn't match their state or county "
+            "(the state/county names were used where they're recognized)."
+        )
+        with st.expander("Show rows with FIPS problems"):
+            st.dataframe(SCHEMA_REPORT["fips_preview"], use_container_width=True)
+    if SCHEMA_REPORT.get("wide_indicators"):
+        st.caption(
+            f"Wide table: {SCHEMA_REPORT['wide_indicators']:,} indicator column(s) melted to long format; "
+            f"units taken from the {SCHEMA_REPORT['unit_source']}"
+            + (" (column names where it's blank)." if SCHEMA_REPORT["unit_source"] == "unit column" else ".")
+        )
+
     st.divider()
 
     # --- Data Quality Check / Cleaning Suggestions ---
@@ -1650,11 +3635,33 @@ with tab_overview:
     # --- Flagged Rows Preview ---
     st.subheader("Flagged Rows Preview")
 
-    if FLAGGED_ROWS is None or FLAGGED_ROWS.empty:
+    flag_counts = DATA_PROFILE["flag_counts"]
+    if not DATA_PROFILE["flags"].any():
         st.info("No specific rows flagged. That’s a good sign — or your file is very clean.")
     else:
-        st.caption("Sample of rows with missing, negative, duplicate, or otherwise flagged values.")
-        st.dataframe(FLAGGED_ROWS.head(50), use_container_width=True)
+        st.caption("Rows with missing, negative, duplicate, or otherwise flagged values.")
+        present = [bit for bit in FLAG_LABELS if flag_counts[bit]]
+        fc1, fc2 = st.columns([3, 1])
+        flag_sel = fc1.multiselect(
+            "Flag types",
+            present,
+            default=present,
+            format_func=lambda bit: f"{FLAG_LABELS[bit]} ({flag_counts[bit]:,})",
+            key="flagged_types"
+        )
+        page_size = fc2.selectbox("Rows per page", [25, 50, 100, 250], index=1, key="flagged_page_size")
+        flag_mask = sum(flag_sel)
+        n_matching = len(flagged_positions(DATA_PROFILE, flag_mask))
+        n_pages = max(1, -(-n_matching // page_size))
+        page = st.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages, value=1, step=1,
+                               key="flagged_page") if n_pages > 1 else 1
+        page_rows = flagged_rows(df, DATA_PROFILE, limit=page_size, mask=flag_mask, start=(page - 1) * page_size)
+        if page_rows.empty:
+            st.info("No rows match the selected flag types.")
+        else:
+            st.dataframe(page_rows, use_container_width=True)
+            st.caption(f"Showing {(page - 1) * page_size + 1:,}–{(page - 1) * page_size + len(page_rows):,} "
+                       f"of {n_matching:,} flagged row(s).")
 
     st.divider()
 
@@ -1672,24 +3679,14 @@ with tab_overview:
     # --- Download cleaned version (simple demo cleaner) ---
     st.subheader("Download Cleaned Data (Demo)")
 
-    def _clean_for_export(df_clean: pd.DataFrame) -> pd.DataFrame:
+    def _clean_for_export(df_clean: pd.DataFrame, profile: dict) -> pd.DataFrame:
         if df_clean is None or df_clean.empty:
             return pd.DataFrame()
-        work = df_clean.copy()
-        # Drop duplicate rows
-        work = work.drop_duplicates()
-        # Drop rows with missing year or value
-        if "year" in work.columns:
-            work = work[work["year"].notna()]
-        if "value" in work.columns:
-            work = work[work["value"].notna()]
-        # Drop negative values for these common indicators
-        if "indicator" in work.columns and "value" in work.columns:
-            neg_mask = (work["value"] < 0)
-            work = work[~neg_mask]
-        return work
-
-    CLEANED_EXPORT = _clean_for_export(df)
+        # Drop duplicate keys (first kept), rows with missing year or value, and negative values
+        drop = FLAG_DUPLICATE | FLAG_MISSING_YEAR | FLAG_MISSING_VALUE | FLAG_NEGATIVE
+        return df_clean[(profile["flags"] & drop) == 0]
+
+    CLEANED_EXPORT = _clean_for_export(df, DATA_PROFILE)
 
     if CLEANED_EXPORT is None or CLEANED_EXPORT.empty:
         st.info("No cleaned data available to download yet.")
@@ -1731,58 +3728,424 @@ with tab_trends:
         st.caption(f"{len(dfi):,} rows after filters")
 
 # Priority (equity-weighted)
-def compute_priority_df(pivot: pd.DataFrame, weights: dict) -> pd.DataFrame:
-    if pivot is None or pivot.empty: return pd.DataFrame()
-    z = pivot.apply(zscore, axis=0)
-    score = 0; used=[]
-    for lbl, w in weights.items():
-        col = next((c for c in z.columns if c.lower().startswith(lbl.lower())), None)
+# ---------- Indicator registry (direction, unit, domain, default weight) ----------
+# direction +1: a higher value means more need; −1: a higher value means less need
+# (e.g. graduation rates). Scoring reads the directions once per pivot into a sign
+# vector that is folded into the weight vector, so polarity is applied in the same
+# matrix-vector product. Names match exactly or by label prefix, like weight labels.
+INDICATOR_REGISTRY = {
+    "Obesity (%)":           {"direction": 1,  "unit": "percent", "domain": "Chronic Disease",          "weight": 1.0},
+    "Food Desert (%)":       {"direction": 1,  "unit": "percent", "domain": "Food Access",              "weight": 1.0},
+    "PM2.5 (µg/m³)":         {"direction": 1,  "unit": "ugm3",    "domain": "Environmental Health",     "weight": 1.0},
+    "Uninsured (%)":         {"direction": 1,  "unit": "percent", "domain": "Healthcare Access",        "weight": 0.5},
+    "No Car Households (%)": {"direction": 1,  "unit": "percent", "domain": "Housing & Transportation", "weight": 0.5},
+    "Low Income (%)":        {"direction": 1,  "unit": "percent", "domain": "Economic Stability",       "weight": 1.0},
+    "Unemployment (%)":      {"direction": 1,  "unit": "percent", "domain": "Economic Stability",       "weight": 0.8},
+    "Rent Burden (%)":       {"direction": 1,  "unit": "percent", "domain": "Housing & Transportation", "weight": 0.7},
+    "High School Grad (%)":  {"direction": -1, "unit": "percent", "domain": "Education & Outreach",     "weight": 0.5},
+    "Food Insecurity (%)":   {"direction": 1,  "unit": "percent", "domain": "Food Access",              "weight": 1.2},
+}
+_REGISTRY_PREFIXES = [(name.split("(")[0].strip().lower(), name) for name in INDICATOR_REGISTRY]
+
+
+def indicator_meta(name: str) -> dict:
+    """
+    Registry entry for an indicator name (exact, else the first registry label it
+    starts with). Unknown indicators: direction +1, unit inferred from the name,
+    domain "Other", weight None.
+    """
+    entry = INDICATOR_REGISTRY.get(name)
+    if entry is None:
+        lower = str(name).lower()
+        entry = next((INDICATOR_REGISTRY[n] for prefix, n in _REGISTRY_PREFIXES if lower.startswith(prefix)), None)
+    return dict(entry) if entry is not None else {"direction": 1, "unit": infer_unit(name), "domain": "Other", "weight": None}
+
+
+def indicator_signs(columns) -> np.ndarray:
+    """+1/−1 per indicator column, from the registry directions."""
+    return np.array([indicator_meta(c)["direction"] for c in columns], dtype="float64")
+
+
+def default_weight(name: str, fallback: float = 1.0) -> float:
+    """The registry's default weight for an indicator, else `fallback`."""
+    weight = indicator_meta(name)["weight"]
+    return float(weight) if weight is not None else fallback
+
+
+# ---------- Priority scoring engine ----------
+# The standardized matrix of a pivot is computed once and cached per pivot key,
+# standardization mode and missing-value policy, and weight labels are matched to
+# columns (case-insensitive prefix, first match) once per label. A weight change
+# is then one matrix-vector product plus a top-N pick.
+SCORE_CACHE_MAX_ENTRIES = 8
+STANDARDIZATION_MODES = {
+    "z": "Z-score (mean / SD)",
+    "robust": "Robust (median / MAD)",
+    "percentile": "Percentile rank",
+    "minmax": "Min–max (0–1)",
+}
+MISSING_POLICIES = {
+    "skip": "Skip — re-weight the indicators a county has",
+    "impute": "Impute — state median (else overall median)",
+    "penalize": "Penalize — the indicator's least-need value",
+}
+
+
+def _percentile_rank(x: np.ndarray, axis: int) -> np.ndarray:
+    """Centered percentile rank (rank − ½) / count − ½ along `axis` (ties averaged, NaN kept)."""
+    moved = np.moveaxis(x, axis, 0)
+    frame = pd.DataFrame(moved.reshape(moved.shape[0], -1))
+    ranked = ((frame.rank(axis=0) - 0.5) / frame.count() - 0.5).to_numpy()
+    return np.moveaxis(ranked.reshape(moved.shape), 0, axis)
+
+
+def standardize(x: np.ndarray, mode: str = "z", axis: int = 0) -> np.ndarray:
+    """
+    Standardize every column of `x` along `axis` (counties), ignoring NaN:
+      z          (x − mean) / SD
+      robust     (x − median) / (1.4826 · MAD), SD when the MAD is 0
+      percentile (rank − ½) / count − ½
+      minmax     (x − min) / (max − min)
+    Constant columns standardize to 0.
+    """
+    if mode == "percentile":
+        return _percentile_rank(x, axis)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)   # all-empty columns stay NaN
+        if mode == "z":
+            center, scale = np.nanmean(x, axis, keepdims=True), np.nanstd(x, axis, keepdims=True)
+        elif mode == "robust":
+            center = np.nanmedian(x, axis, keepdims=True)
+            scale = 1.4826 * np.nanmedian(np.abs(x - center), axis, keepdims=True)
+            scale = np.where(scale == 0, np.nanstd(x, axis, keepdims=True), scale)
+        elif mode == "minmax":
+            center = np.nanmin(x, axis, keepdims=True)
+            scale = np.nanmax(x, axis, keepdims=True) - center
+        else:
+            raise ValueError(f"Unknown standardization mode: {mode}")
+    return (x - center) / np.where(scale == 0, np.inf, scale)
+
+
+def _impute_group_median(x: np.ndarray, groups: np.ndarray, axis: int) -> np.ndarray:
+    """Fill NaN with the median of the same group (state) along `axis`, then the overall median."""
+    moved = np.moveaxis(x, axis, 0)
+    frame = pd.DataFrame(moved.reshape(moved.shape[0], -1))
+    filled = frame.fillna(frame.groupby(groups).transform("median")).fillna(frame.median())
+    return np.moveaxis(filled.to_numpy().reshape(moved.shape), 0, axis)
+
+
+def standardized_engine(x: np.ndarray, groups: np.ndarray, mode: str = "z", missing: str = "skip",
+                        axis: int = 0, signs: np.ndarray = None) -> dict:
+    """
+    Apply a missing-value policy and standardization to a county matrix/cube →
+    {"z", "z0", "present", "signs"}: values with NaN, NaN → 0, the non-missing
+    mask as float32 and the indicator directions (last axis; all +1 when not given).
+    "skip" leaves gaps for weighted_scores to re-weight around; "impute" and
+    "penalize" fill them (an indicator nobody has stays empty), but only for
+    counties (county-years in a cube) with at least one value — the rest stay
+    empty, so they're neither standardized nor scored.
+    """
+    signs = np.ones(x.shape[-1]) if signs is None else signs
+    if missing not in MISSING_POLICIES:
+        raise ValueError(f"Unknown missing-value policy: {missing}")
+    observed = ~np.isnan(x).all(axis=-1, keepdims=True)
+    if missing == "impute":
+        x = np.where(observed, _impute_group_median(x, groups, axis), np.nan)
+    z = standardize(x, mode, axis)
+    if missing == "penalize":
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            least_need = np.where(signs > 0, np.nanmin(z, axis, keepdims=True), np.nanmax(z, axis, keepdims=True))
+            z = np.where(np.isnan(z) & observed, least_need, z)
+    present = ~np.isnan(z)
+    return {"z": z, "z0": np.where(present, z, 0.0), "present": present.astype("float32"), "signs": signs}
+
+
+def score_matrix(pivot: pd.DataFrame, key=None, mode: str = "z", missing: str = "skip") -> dict:
+    """
+    Standardized pivot columns (see standardized_engine) plus "index", "columns",
+    "lower" and a "labels" memo of weight label → column position.
+    Cached per (key, mode, missing) when a key (e.g. the view_pivot key) is given.
+    """
+    if key is not None:
+        cached = lru_get("score_matrix", (key, mode, missing))
+        if cached is not None:
+            return cached
+    groups = pd.factorize(pivot.index.get_level_values("state"))[0] if "state" in pivot.index.names else np.zeros(len(pivot))
+    engine = standardized_engine(pivot.to_numpy(dtype="float64"), groups, mode, missing,
+                                 signs=indicator_signs(pivot.columns))
+    engine.update({"index": pivot.index, "columns": pivot.columns,
+                   "lower": [str(c).lower() for c in pivot.columns], "labels": {}})
+    if key is not None:
+        lru_put("score_matrix", (key, mode, missing), engine, SCORE_CACHE_MAX_ENTRIES)
+    return engine
+
+
+def _weight_column(engine: dict, label: str):
+    """Position of the first column starting with `label` (case-insensitive), memoized; None if none."""
+    memo = engine["labels"]
+    if label not in memo:
+        prefix = label.lower()
+        memo[label] = next((i for i, c in enumerate(engine["lower"]) if c.startswith(prefix)), None)
+    return memo[label]
+
+
+def weighted_scores(engine: dict, weights: dict) -> tuple:
+    """
+    Σ direction × weight × standardized value over the columns the weight labels
+    match, along the engine's last axis → (score, used columns). Values still missing after the
+    policy are skipped and the score rescaled by total / present weight, so gaps
+    neither drop a county nor pull it toward 0; NaN only when none of its
+    weighted indicators are present.
+    """
+    w = np.zeros(len(engine["columns"]))
+    used = []
+    for lbl, wt in weights.items():
+        col = _weight_column(engine, lbl)
         if col is not None:
-            score = score + w * z[col]; used.append(col)
-    out = z.copy(); out["E_Score"] = score; out["__used__"]=", ".join(used) if used else "(none)"
-    return out.reset_index().sort_values("E_Score", ascending=False)
+            w[col] += wt * engine["signs"][col]; used.append(engine["columns"][col])
+    if not used:
+        return np.zeros(engine["z0"].shape[:-1]), used
+    score = engine["z0"] @ w
+    total = np.abs(w).sum()
+    if total > 0:
+        present = engine["present"] @ np.abs(w).astype("float32")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            score = np.where(present > 0, score * (total / present), np.nan)
+    return score, used
+
+
+def top_positions(score: np.ndarray, top: int = None) -> np.ndarray:
+    """
+    Row positions by descending score (NaN last, ties in row order); only the
+    best `top` when given, picked with a partition instead of a full sort.
+    """
+    key = -np.where(np.isnan(score), -np.inf, score)
+    if top is not None and top < len(key):
+        kth = np.partition(key, top - 1)[top - 1]
+        better = np.flatnonzero(key < kth)
+        cand = np.sort(np.concatenate([better, np.flatnonzero(key == kth)[:top - len(better)]]))
+        return cand[np.argsort(key[cand], kind="stable")]
+    return np.argsort(key, kind="stable")
+
+
+def priority_ranking(pivot: pd.DataFrame, weights: dict, key=None, mode: str = "z", missing: str = "skip") -> dict:
+    """
+    E_Score for every pivot row → {"engine", "score", "used"} (see weighted_scores),
+    with the pivot standardized by `mode` under the `missing` policy. `key`
+    caches the standardized matrix across reruns (see score_matrix). Rows are
+    only built by priority_page.
+    """
+    engine = score_matrix(pivot, key, mode, missing)
+    score, used = weighted_scores(engine, weights)
+    return {"engine": engine, "score": score, "used": used}
+
+
+def priority_page(ranking: dict, start: int = 0, size: int = None) -> pd.DataFrame:
+    """
+    Ranks [start, start + size) of a priority_ranking (all from start when size
+    is None) as rows of z-scores + E_Score + __used__, best first. Only a
+    partition up to the page end is done, and only the page's rows are built.
+    """
+    engine, score = ranking["engine"], ranking["score"]
+    order = top_positions(score, None if size is None else start + size)[start:]
+    out = pd.DataFrame(engine["z"][order], index=engine["index"][order], columns=engine["columns"])
+    out["E_Score"] = score[order]; out["__used__"] = ", ".join(ranking["used"]) if ranking["used"] else "(none)"
+    out = out.reset_index()
+    out.index = order
+    return out
+
+
+def compute_priority_df(pivot: pd.DataFrame, weights: dict, key=None, top: int = None,
+                        mode: str = "z", missing: str = "skip") -> pd.DataFrame:
+    """Ranked priority table (see priority_ranking); `top` keeps only the best rows."""
+    if pivot is None or pivot.empty: return pd.DataFrame()
+    return priority_page(priority_ranking(pivot, weights, key, mode, missing), 0, top)
+
+# ---------- Panel scoring (every year at once) ----------
+# A county × indicator × year cube is built once per filtered view. Each year is
+# standardized against that year's counties, so one tensor-vector product gives
+# the E_Score of every county in every year, and trajectories/rank changes are
+# read off the resulting year × county matrix.
+PANEL_CACHE_MAX_ENTRIES = 4
+
+
+def panel_cube(view: pd.DataFrame, key=None) -> dict:
+    """
+    The view's county × indicator means per year → {"years", "index", "columns",
+    "cube"} with cube shaped (year, county, indicator). Cached per key when one is given.
+    """
+    if key is not None:
+        cached = lru_get("panel_cube", key)
+        if cached is not None:
+            return cached
+    codes = _pivot_codes(view) if view is not None and not view.empty else None
+    if codes is None:
+        return {"years": np.empty(0, dtype="int64"), "index": pd.MultiIndex.from_arrays([[], [], []], names=["state", "county", "fips"]),
+                "columns": pd.Index([]), "cube": np.empty((0, 0, 0))}
+    pos, row, first, col, names = codes
+    year_idx, years = pd.factorize(view["year"].to_numpy(dtype="int64")[pos], sort=True)
+    shape = (len(years), len(first), len(names))
+    cube = _cell_means((year_idx * shape[1] + row) * shape[2] + col,
+                       view["value"].to_numpy(dtype="float64")[pos], shape)
+    labels = view[["state", "county", "fips"]].iloc[first].reset_index(drop=True)
+    panel = {"years": np.asarray(years), "index": pd.MultiIndex.from_frame(labels), "columns": names, "cube": cube}
+    if key is not None:
+        lru_put("panel_cube", key, panel, PANEL_CACHE_MAX_ENTRIES, VIEW_CACHE_MAX_BYTES)
+    return panel
+
+
+def panel_engine(panel: dict, key=None, mode: str = "z", missing: str = "skip") -> dict:
+    """
+    The cube standardized within each year (see standardized_engine), plus the
+    panel's labels and a weight-label memo. Cached per (key, mode, missing).
+    """
+    if key is not None:
+        cached = lru_get("panel_engine", (key, mode, missing))
+        if cached is not None:
+            return cached
+    groups = pd.factorize(panel["index"].get_level_values("state"))[0]
+    engine = standardized_engine(panel["cube"], groups, mode, missing, axis=1,
+                                 signs=indicator_signs(panel["columns"]))
+    engine.update({"years": panel["years"], "index": panel["index"], "columns": panel["columns"],
+                   "lower": [str(c).lower() for c in panel["columns"]], "labels": {}})
+    if key is not None:
+        lru_put("panel_engine", (key, mode, missing), engine, PANEL_CACHE_MAX_ENTRIES, VIEW_CACHE_MAX_BYTES)
+    return engine
+
+
+def panel_scores(engine: dict, weights: dict) -> dict:
+    """
+    E_Score of every county in every year → {"score", "rank", "used"}: (year, county)
+    arrays (see weighted_scores). Rank 1 = highest need that year; unscored → NaN.
+    """
+    score, used = weighted_scores(engine, weights)
+    n_years, n_counties = score.shape
+    key = -np.where(np.isnan(score), -np.inf, score)
+    order = np.argsort(key, axis=1, kind="stable")
+    rank = np.empty(score.shape)
+    rank[np.arange(n_years)[:, None], order] = np.arange(1, n_counties + 1)
+    rank[np.isnan(score)] = np.nan
+    return {"score": score, "rank": rank, "used": used}
+
 
+def score_trajectories(panel: dict, scores: dict) -> pd.DataFrame:
+    """
+    One row per county scored in at least two years: first/last scored year,
+    E_Score and rank then, their changes and the per-year least-squares slope of
+    the score. Sorted by score change, so counties getting worse come first.
+    The frame's index is the county's position in the panel.
+    """
+    score, rank, years = scores["score"], scores["rank"], panel["years"].astype("float64")
+    ok = ~np.isnan(score)
+    n = ok.sum(axis=0)
+    keep = np.flatnonzero(n >= 2)
+    if not len(keep):
+        return pd.DataFrame()
+    ok, score, rank, n = ok[:, keep], score[:, keep], rank[:, keep], n[keep]
+    cols = np.arange(len(keep))
+    i0 = ok.argmax(axis=0)
+    i1 = len(years) - 1 - ok[::-1].argmax(axis=0)
+    x = np.where(ok, years[:, None], 0.0)
+    y = np.where(ok, score, 0.0)
+    sx, sy, sxx, sxy = x.sum(0), y.sum(0), (x * x).sum(0), (x * y).sum(0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+
+    out = panel["index"][keep].to_frame(index=False)
+    out["first_year"] = years[i0].astype("int64")
+    out["last_year"] = years[i1].astype("int64")
+    out["score_first"] = score[i0, cols]
+    out["score_last"] = score[i1, cols]
+    out["score_change"] = out["score_last"] - out["score_first"]
+    out["score_slope"] = slope
+    out["rank_first"] = rank[i0, cols].astype("int64")
+    out["rank_last"] = rank[i1, cols].astype("int64")
+    out["rank_change"] = out["rank_first"] - out["rank_last"]   # > 0: moved up the need ranking
+    out.index = keep
+    return out.sort_values("score_change", ascending=False, kind="stable")
+
+
+PRIORITY_TOP_ROWS = 15   # rows kept in priority_df for the reports/narratives
+priority_rank, priority_df = None, pd.DataFrame()
+score_mode, missing_policy = "z", "skip"   # shared with the Map and Grant Writer
 with tab_priority:
     st.subheader("Equity-Weighted Priority Scoring")
     if dfx.empty:
         st.info("Upload data or enable Demo Mode.")
     else:
-        latest = int(dfx["year"].max())
-        df_latest = dfx[dfx["year"]==latest]
-        pivot = derive_pivot(df_latest)
+        latest, pivot = view_pivot(dfx, VIEW_KEY)
+
+        sc1, sc2 = st.columns(2)
+        score_mode = sc1.selectbox("Standardization", list(STANDARDIZATION_MODES),
+                                   format_func=STANDARDIZATION_MODES.get, key="score_mode")
+        missing_policy = sc2.selectbox("Missing values", list(MISSING_POLICIES),
+                                       format_func=MISSING_POLICIES.get, key="score_missing")
 
         # auto sliders for found indicators
         weights = {}
         for ind in sorted(pivot.columns.tolist()):
             label = ind.split("(")[0].strip()
-            default = 1.0 if "Food Desert" in ind or "PM2.5" in ind else 0.8
-            weights[ind] = st.slider(f"{label}", 0.0, 2.0, float(default), 0.1, key=f"w_{ind}")
-
-        priority_df = compute_priority_df(pivot, weights) if not pivot.empty else pd.DataFrame()
-if not priority_df.empty:
-    st.dataframe(priority_df.head(15), use_container_width=True)
-    if FEATURES.get("exports", False):
-        # CSV export
-        st.download_button(
-            "⬇️ Download Priority (CSV)",
-            data=safe_csv_bytes(priority_df),
-            file_name="priority_list.csv",
-            mime="text/csv",
-            key="priority_csv_dl"
-        )
-# ---- SAFE EXCEL EXPORT ----
-excel_bytes = to_excel_bytes(priority_df)
+            default = default_weight(ind, 1.0 if "Food Desert" in ind or "PM2.5" in ind else 0.8)
+            inverse = indicator_meta(ind)["direction"] < 0
+            weights[ind] = st.slider(f"{label}", 0.0, 2.0, float(default), 0.1, key=f"w_{ind}",
+                                     help="Higher values mean less need, so this indicator is scored inversely." if inverse else None)
+
+        if not pivot.empty:
+            priority_rank = priority_ranking(pivot, weights, key=(VIEW_KEY, "latest"), mode=score_mode, missing=missing_policy)
+            priority_df = priority_page(priority_rank, 0, PRIORITY_TOP_ROWS)
+
+    if priority_rank is not None:
+        n_ranked = len(priority_rank["score"])
+        pc1, pc2 = st.columns([3, 1])
+        page_size = pc2.selectbox("Rows per page", [15, 50, 100, 250], index=0, key="priority_page_size")
+        n_pages = max(1, -(-n_ranked // page_size))
+        page = pc1.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages, value=1, step=1,
+                                key="priority_page") if n_pages > 1 else 1
+        page_rows = priority_page(priority_rank, (page - 1) * page_size, page_size)
+        st.dataframe(page_rows, use_container_width=True)
+        st.caption(f"Showing ranks {(page - 1) * page_size + 1:,}–{(page - 1) * page_size + len(page_rows):,} "
+                   f"of {n_ranked:,} counties.")
+
+        # the full table is only built here, for the downloads
+        priority_full = priority_page(priority_rank)
+        if FEATURES.get("exports", False):
+            # CSV export
+            st.download_button(
+                "⬇️ Download Priority (CSV)",
+                data=safe_csv_bytes(priority_full),
+                file_name="priority_list.csv",
+                mime="text/csv",
+                key="priority_csv_dl"
+            )
+        # ---- SAFE EXCEL EXPORT ----
+        excel_bytes = to_excel_bytes(priority_full)
 
-if excel_bytes:
-    st.download_button(
-        "⬇️ Download Priority (Excel)",
-        data=excel_bytes,
-        file_name="priority_list.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        key="priority_xlsx"
-    )
-else:
-    st.info("Excel export unavailable — install XlsxWriter (`pip install XlsxWriter`) to enable it.")
+        if excel_bytes:
+            st.download_button(
+                "⬇️ Download Priority (Excel)",
+                data=excel_bytes,
+                file_name="priority_list.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key="priority_xlsx"
+            )
+        else:
+            st.info("Excel export unavailable — install XlsxWriter (`pip install XlsxWriter`) to enable it.")
+
+        with st.expander("📈 Score trajectories (all years)"):
+            panel = panel_cube(dfx, key=(VIEW_KEY, "panel"))
+            panel_ranking = panel_scores(panel_engine(panel, (VIEW_KEY, "panel"), score_mode, missing_policy), weights)
+            trajectories = score_trajectories(panel, panel_ranking)
+            if trajectories.empty:
+                st.info("Needs at least two years of scored data under the current filters.")
+            else:
+                st.caption("Each year is scored against that year's counties with the weights above; "
+                           "counties whose score rose the most (more need) come first.")
+                st.dataframe(trajectories.head(PRIORITY_TOP_ROWS), use_container_width=True)
+                worst = trajectories.head(5)
+                chart = pd.DataFrame(panel_ranking["score"][:, worst.index], index=panel["years"],
+                                     columns=[f"{c} ({STATE_ABBR.get(s, s)})" for c, s in zip(worst["county"], worst["state"])])
+                st.line_chart(chart)
 
 # Reports (narrative + PDF)
 with tab_reports:
@@ -1848,25 +4211,23 @@ with tab_map:
         st.info("Upload data or enable Demo Mode to see the map.")
     else:
         try:
-            latest_year = int(dfx["year"].max())
-            df_latest_map = dfx[dfx["year"] == latest_year]
-
-            # Pivot (wide) for scoring
-            pivot_map = derive_pivot(df_latest_map)
+            # Pivot (wide) for scoring — shared with the Priority tab
+            latest_year, pivot_map = view_pivot(dfx, VIEW_KEY)
 
             # Weights: use current ones if they exist, else fallback to 1.0 each
             if 'weights' not in locals() or not weights:
-                weights = {col: 1.0 for col in (pivot_map.columns if not pivot_map.empty else [])}
+                weights = {col: default_weight(col) for col in (pivot_map.columns if not pivot_map.empty else [])}
 
             # Compute equity scores (E_Score) per county
-            priority_map = compute_priority_df(pivot_map, weights) if not pivot_map.empty else pd.DataFrame()
+            priority_map = (compute_priority_df(pivot_map, weights, key=(VIEW_KEY, "latest"), mode=score_mode, missing=missing_policy)
+                            if not pivot_map.empty else pd.DataFrame())
 
             if priority_map.empty:
                 st.info("Not enough data to compute scores for the map.")
             else:
                 # Average E_Score per state for choropleth
                 state_scores = (
-                    priority_map.groupby("state", as_index=False)["E_Score"]
+                    priority_map.groupby("state", as_index=False, observed=True)["E_Score"]
                     .mean()
                     .rename(columns={"E_Score": "equity_score"})
                 )
@@ -1932,7 +4293,7 @@ def _trend_blurbs(df_scope: pd.DataFrame) -> list:
     years_sorted = sorted(pd.to_numeric(df_scope["year"], errors="coerce").dropna().unique().tolist())
     slice_years = years_sorted[-3:] if len(years_sorted) >= 3 else years_sorted
     d3 = df_scope[df_scope["year"].isin(slice_years)].copy()
-    for ind, sub in d3.groupby("indicator"):
+    for ind, sub in d3.groupby("indicator", observed=True):
         try:
             sub = sub.groupby("year", as_index=False)["value"].mean().sort_values("year")
             if len(sub) >= 2:
@@ -1962,15 +4323,15 @@ draft = ""
 if build_ai:
     try:
         # scope & latest
-        df_scope = dfx.copy() if ('dfx' in locals() and not dfx.empty) else df.copy()
-        latest_year = int(df_scope["year"].max()) if not df_scope.empty else None
-        piv = derive_pivot(df_scope[df_scope["year"] == latest_year]) if latest_year else derive_pivot(df_scope)
+        df_scope, scope_key = (dfx, VIEW_KEY) if ('dfx' in locals() and not dfx.empty) else (df, view_key(DATASET_KEY))
+        latest_year, piv = view_pivot(df_scope, scope_key)
 
         # weights fallback if none exist
         if 'weights' not in locals() or not weights:
-            weights = {col: 1.0 for col in (piv.columns if not piv.empty else [])}
+            weights = {col: default_weight(col) for col in (piv.columns if not piv.empty else [])}
 
-        pr_df = compute_priority_df(piv, weights) if not piv.empty else pd.DataFrame()
+        pr_df = (compute_priority_df(piv, weights, key=(scope_key, "latest"), top=3, mode=score_mode, missing=missing_policy)
+                 if not piv.empty else pd.DataFrame())
         top_list = ", ".join([f"{r.county} ({r.state})" for _, r in pr_df.head(3).iterrows()]) if not pr_df.empty else "priority areas identified"
 
         used_cols = []
@@ -2257,25 +4618,7 @@ def local_resources(state: str, county: str) -> list:
 
     return results
 # --- Full list of Illinois counties for Resources tab ---
-ILLINOIS_COUNTIES = [
-    "Adams", "Alexander", "Bond", "Boone", "Brown", "Bureau",
-    "Calhoun", "Carroll", "Cass", "Champaign", "Christian", "Clark",
-    "Clay", "Clinton", "Coles", "Cook", "Crawford", "Cumberland",
-    "DeKalb", "De Witt", "Douglas", "DuPage", "Edgar", "Edwards",
-    "Effingham", "Fayette", "Ford", "Franklin", "Fulton", "Gallatin",
-    "Greene", "Grundy", "Hamilton", "Hancock", "Hardin", "Henderson",
-    "Henry", "Iroquois", "Jackson", "Jasper", "Jefferson", "Jersey",
-    "Jo Daviess", "Johnson", "Kane", "Kankakee", "Kendall", "Knox",
-    "LaSalle", "Lake", "Lawrence", "Lee", "Livingston", "Logan",
-    "McDonough", "McHenry", "McLean", "Macon", "Macoupin", "Madison",
-    "Marion", "Marshall", "Mason", "Massac", "Menard", "Mercer",
-    "Monroe", "Montgomery", "Morgan", "Moultrie", "Ogle", "Peoria",
-    "Perry", "Piatt", "Pike", "Pope", "Pulaski", "Putnam", "Randolph",
-    "Richland", "Rock Island", "St. Clair", "Saline", "Sangamon",
-    "Schuyler", "Scott", "Shelby", "Stark", "Stephenson", "Tazewell",
-    "Union", "Vermilion", "Wabash", "Warren", "Washington", "Wayne",
-    "White", "Whiteside", "Will", "Williamson", "Winnebago", "Woodford",
-]
+ILLINOIS_COUNTIES = [ref["county"] for fips, ref in COUNTY_REFERENCE.items() if fips.startswith("17")]
 
 # ---------- Resources Tab (Smart, Need-Based) ----------
 with tab_resources:
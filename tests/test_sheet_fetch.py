@@ -0,0 +1,93 @@
+"""
+Sheet fetch layer against a local http.server standing in for the Google export:
+ETag / 304 revalidation, the TTL, background refresh and the offline fallback.
+"""
+import sys
+import threading
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from vitalview_sheets import fetch_sheet_csv  # noqa: E402
+
+
+class _SheetHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        srv = self.server
+        srv.requests.append(self.headers.get("If-None-Match"))
+        etag = f'"v{srv.version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = srv.body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _SheetHandler)
+    srv.requests, srv.version, srv.body = [], 1, "state,county,year\nIllinois,Cook,2020\n"
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    srv.url = f"http://127.0.0.1:{srv.server_address[1]}/export?format=csv"
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _publish(srv, body):
+    srv.version += 1
+    srv.body = body
+
+
+def test_fresh_cache_skips_the_network(server, tmp_path):
+    first = fetch_sheet_csv(server.url, ttl=3600, cache_dir=str(tmp_path))
+    again = fetch_sheet_csv(server.url, ttl=3600, cache_dir=str(tmp_path))
+    assert first == again == server.body.encode("utf-8")
+    assert server.requests == [None]
+
+
+def test_stale_cache_revalidates_with_etag(server, tmp_path):
+    fetch_sheet_csv(server.url, cache_dir=str(tmp_path))
+    body = fetch_sheet_csv(server.url, ttl=0, cache_dir=str(tmp_path), background=False)
+    assert body == server.body.encode("utf-8")
+    assert server.requests == [None, '"v1"']             # conditional GET, answered 304
+
+    _publish(server, "state,county,year\nIllinois,Lake,2021\n")
+    body = fetch_sheet_csv(server.url, ttl=0, cache_dir=str(tmp_path), background=False)
+    assert body == b"state,county,year\nIllinois,Lake,2021\n"
+    # the new copy is fresh again until the TTL passes
+    assert fetch_sheet_csv(server.url, ttl=3600, cache_dir=str(tmp_path)) == body
+    assert len(server.requests) == 3
+
+
+def test_background_refresh_serves_cached_copy_first(server, tmp_path):
+    old = fetch_sheet_csv(server.url, cache_dir=str(tmp_path))
+    _publish(server, "state,county,year\nIllinois,Will,2022\n")
+    assert fetch_sheet_csv(server.url, ttl=0, cache_dir=str(tmp_path)) == old
+    for t in threading.enumerate():
+        if t.name.startswith("vitalview-sheet-"):
+            t.join(timeout=10)
+    assert fetch_sheet_csv(server.url, ttl=3600, cache_dir=str(tmp_path)) == server.body.encode("utf-8")
+
+
+def test_offline_falls_back_to_last_good_copy(server, tmp_path):
+    body = fetch_sheet_csv(server.url, cache_dir=str(tmp_path))
+    server.shutdown()
+    server.server_close()
+    assert fetch_sheet_csv(server.url, ttl=0, timeout=2, cache_dir=str(tmp_path), background=False) == body
+    with pytest.raises(urllib.error.URLError):
+        fetch_sheet_csv(server.url, timeout=2, cache_dir=str(tmp_path / "empty"))
@@ -0,0 +1,125 @@
+"""
+VitalView Google Sheet fetch layer (disk cache + HTTP revalidation).
+
+The CSV export is cached on disk with its ETag / Last-Modified. Within the TTL
+the cached bytes are served as-is; after it, they are still served while a
+background thread revalidates with a conditional GET (304 → keep, 200 → replace).
+fetch_sheet_csv works with any http(s) URL, so a local http.server can stand in
+for Google in tests.
+
+Stdlib only, so it can be imported (and tested) without Streamlit.
+"""
+import os, json, time, hashlib, threading
+import urllib.request, urllib.error
+
+SHEET_CACHE_DIR = os.getenv("VITALVIEW_SHEET_CACHE", "vitalview_sheet_cache")
+SHEET_CACHE_TTL = int(os.getenv("VITALVIEW_SHEET_TTL", "300"))        # seconds
+SHEET_FETCH_TIMEOUT = float(os.getenv("VITALVIEW_SHEET_TIMEOUT", "15"))  # seconds
+
+
+def _sheet_cache_paths(csv_url: str, cache_dir: str) -> tuple:
+    stem = hashlib.blake2b(csv_url.encode("utf-8"), digest_size=12).hexdigest()
+    return os.path.join(cache_dir, stem + ".csv"), os.path.join(cache_dir, stem + ".json")
+
+
+def _revalidate_sheet(csv_url: str, cache_dir: str, timeout: float) -> bytes:
+    """Conditional GET against the cached validators; refreshes the cache files and returns the body."""
+    data_path, meta_path = _sheet_cache_paths(csv_url, cache_dir)
+    meta = {}
+    if os.path.exists(meta_path) and os.path.exists(data_path):
+        with open(meta_path, "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+
+    req = urllib.request.Request(csv_url, headers={"User-Agent": "VitalView"})
+    if meta.get("etag"):
+        req.add_header("If-None-Match", meta["etag"])
+    if meta.get("last_modified"):
+        req.add_header("If-Modified-Since", meta["last_modified"])
+
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            body = resp.read()
+            meta = {"url": csv_url, "etag": resp.headers.get("ETag"),
+                    "last_modified": resp.headers.get("Last-Modified")}
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(data_path + ".tmp", "wb") as fh:
+            fh.write(body)
+        os.replace(data_path + ".tmp", data_path)
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            raise
+        with open(data_path, "rb") as fh:
+            body = fh.read()
+
+    meta["fetched_at"] = time.time()
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as fh:
+        json.dump(meta, fh)
+    os.replace(meta_path + ".tmp", meta_path)
+    return body
+
+
+def fetch_sheet_csv(csv_url: str, ttl: int = None, timeout: float = None,
+                    cache_dir: str = None, background: bool = True) -> bytes:
+    """
+    Return the CSV bytes for an export URL, using the disk cache:
+      - fresh cache (age < ttl)      → cached bytes, no network
+      - stale cache                  → cached bytes now, revalidate in a background thread
+                                       (or inline when background=False)
+      - no cache                     → blocking fetch (raises on network errors)
+    """
+    ttl = SHEET_CACHE_TTL if ttl is None else ttl
+    timeout = SHEET_FETCH_TIMEOUT if timeout is None else timeout
+    cache_dir = cache_dir or SHEET_CACHE_DIR
+    data_path, meta_path = _sheet_cache_paths(csv_url, cache_dir)
+
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return _revalidate_sheet(csv_url, cache_dir, timeout)
+
+    with open(meta_path, "r", encoding="utf-8") as fh:
+        fetched_at = json.load(fh).get("fetched_at", 0)
+    with open(data_path, "rb") as fh:
+        cached = fh.read()
+    if time.time() - fetched_at < ttl:
+        return cached
+
+    if not background:
+        try:
+            return _revalidate_sheet(csv_url, cache_dir, timeout)
+        except (OSError, ValueError):
+            return cached  # network trouble → serve the last good copy
+
+    # one refresher per URL: threads outlive the script rerun, so look them up by name
+    thread_name = "vitalview-sheet-" + os.path.basename(data_path)
+    if not any(t.name == thread_name and t.is_alive() for t in threading.enumerate()):
+        def _refresh():
+            try:
+                _revalidate_sheet(csv_url, cache_dir, timeout)
+            except Exception:
+                pass  # keep serving the cached copy; next rerun will retry
+        threading.Thread(target=_refresh, name=thread_name, daemon=True).start()
+    return cached
+
+
+def sheet_csv_url(url: str) -> str:
+    """
+    Turn a public Google Sheet link into its CSV export link.
+
+    - Works if the sheet is 'Anyone with the link can view'
+    - URL examples it supports:
+      * .../edit#gid=0
+      * .../edit?usp=sharing
+      * .../view...
+    """
+    url = url.strip()
+
+    if "docs.google.com" not in url:
+        raise ValueError("That doesn't look like a Google Sheets URL.")
+
+    # Basic transformation: strip anything after '/edit' or '/view' and add export
+    base = url
+    for marker in ["/edit", "/view"]:
+        if marker in base:
+            base = base.split(marker)[0]
+            break
+
+    return base.rstrip("/") + "/export?format=csv"